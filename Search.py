@@ -1,84 +1,31 @@
 import os
-import re
-import fitz  # PyMuPDF for PDFs
-import docx
-import pptx
-import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, Menu
 import subprocess
 import platform
+import profiling
+from text_cache import TextCache
+from search_index import SearchIndex
+from folder_search import search_folder
+from query import compile_query, QuerySyntaxError
+from walker import walk_files
+from snippets import format_hit
+from dedup import find_duplicates, group_duplicates
 
 RESUME_FOLDER = "Resume_Download"
-
-def extract_text_from_pdf(filepath):
-    text = ""
-    try:
-        doc = fitz.open(filepath)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-    return text
-
-def extract_text_from_docx(filepath):
-    try:
-        doc = docx.Document(filepath)
-        return "\n".join([para.text for para in doc.paragraphs])
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_pptx(filepath):
-    try:
-        presentation = pptx.Presentation(filepath)
-        text = []
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text.append(shape.text)
-        return "\n".join(text)
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_excel(filepath):
-    try:
-        df = pd.read_excel(filepath, sheet_name=None)
-        text = "\n".join([df[sheet].to_string() for sheet in df])
-        return text
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text(filepath):
-    ext = filepath.split(".")[-1].lower()
-    if ext == "pdf":
-        return extract_text_from_pdf(filepath)
-    elif ext == "docx":
-        return extract_text_from_docx(filepath)
-    elif ext == "pptx":
-        return extract_text_from_pptx(filepath)
-    elif ext in ["xls", "xlsx"]:
-        return extract_text_from_excel(filepath)
-    else:
-        print(f"Unsupported format: {filepath}")
-        return ""
-
-def boolean_search(text, query):
-    query = query.replace("AND", "&").replace("OR", "|").replace("NOT", "~")
-    words = re.findall(r'\w+', query)
-    
-    for word in words:
-        if word.lower() not in text.lower():
-            query = query.replace(word, "False")
-        else:
-            query = query.replace(word, "True")
-    
-    try:
-        return eval(query)
-    except:
-        return False
+TEXT_CACHE = TextCache()
+USE_SEARCH_INDEX = True  # Answer queries from the folder's inverted index
+RECURSIVE_SEARCH = True  # Also search subfolders
+INCLUDE_PATTERNS = []  # e.g. ["*.pdf", "2024/*"]; empty means every supported file
+EXCLUDE_PATTERNS = []  # e.g. ["Archive", "~$*"]; matching folders are skipped entirely
+RANK_RESULTS = True  # List the best matches first (BM25); needs the index
+MAX_RESULTS = 200  # With ranking, only the best this many matches are listed
+GROUP_DUPLICATES = True  # Search identical files once and list copies under the original
+RESULT_LINES = {}  # Line number in result_text -> file listed there (its snippet lines included)
+PROFILE_SEARCHES = False  # Time every file and stage of a search and show the report afterwards
+
+if PROFILE_SEARCHES:
+    profiling.enable()
 
 def on_select(event):
     try:
@@ -96,9 +43,7 @@ def open_file(event):
     try:
         # Find the selected line based on highlight
         index = result_text.index(tk.CURRENT)
-        line_start = f"{index.split('.')[0]}.0"
-        line_end = f"{index.split('.')[0]}.end"
-        selected_text = result_text.get(line_start, line_end).strip()
+        selected_text = RESULT_LINES.get(int(index.split('.')[0]), "")
 
         if selected_text:
             filepath = os.path.join(RESUME_FOLDER, selected_text)
@@ -117,20 +62,70 @@ def search_resumes():
     if not query:
         messagebox.showerror("Error", "Please enter a search query.")
         return
+    try:
+        compile_query(query)  # Reject malformed queries before touching any files
+    except QuerySyntaxError as e:
+        messagebox.showerror("Error", f"Invalid search query: {e}")
+        return
     
+    profiling.reset()
+    filepaths = list(walk_files(RESUME_FOLDER, RECURSIVE_SEARCH, INCLUDE_PATTERNS, EXCLUDE_PATTERNS))
+    index = SearchIndex(RESUME_FOLDER) if USE_SEARCH_INDEX else None
+    duplicates = find_duplicates(filepaths, TEXT_CACHE) if GROUP_DUPLICATES else {}
+    copies = {
+        os.path.relpath(original, RESUME_FOLDER): [os.path.relpath(copy, RESUME_FOLDER) for copy in group]
+        for original, group in group_duplicates(duplicates).items()
+    }
     matching_files = []
-    for file in os.listdir(RESUME_FOLDER):
-        filepath = os.path.join(RESUME_FOLDER, file)
-        if os.path.isfile(filepath):
-            text = extract_text(filepath)
-            if boolean_search(text, query):
-                matching_files.append(file)
+    hits = {}
+    for path, matched, found in search_folder(filepaths, query, cache=TEXT_CACHE, index=index, snippets=True,
+                                              duplicates=duplicates):
+        if matched and path not in duplicates:
+            relpath = os.path.relpath(path, RESUME_FOLDER)
+            matching_files.append(relpath)
+            hits[relpath] = found
+    matching_files.sort()
+    if index is not None:
+        if RANK_RESULTS and matching_files:
+            matching_files = [
+                os.path.relpath(path, RESUME_FOLDER)
+                for path, score in index.rank(query, k=MAX_RESULTS, within=filepaths)
+            ]
+        index.close()
+    print(f"Text cache: {TEXT_CACHE.hits} hits, {TEXT_CACHE.misses} misses")
     
     result_text.delete("1.0", tk.END)
+    RESULT_LINES.clear()
     if matching_files:
-        result_text.insert(tk.END, "\n".join(matching_files))
+        # Each file is followed by indented lines naming its identical
+        # copies (which open themselves) and showing where it matched
+        lines = []
+        for relpath in matching_files:
+            lines.append((relpath, None))
+            lines.extend((copy, f"    = {copy}") for copy in copies.get(relpath, []))
+            lines.extend((relpath, f"    {format_hit(hit)}") for hit in hits.get(relpath, []))
+        for number, (relpath, snippet) in enumerate(lines, start=1):
+            RESULT_LINES[number] = relpath
+            end = "\n" if number < len(lines) else ""
+            if snippet is None:
+                result_text.insert(tk.END, relpath + end)
+            else:
+                result_text.insert(tk.END, snippet + end, "snippet")
+        result_text.tag_config("snippet", foreground="gray40")
     else:
         result_text.insert(tk.END, "No matching resumes found.")
+    if PROFILE_SEARCHES:
+        show_profile()
+
+def show_profile():
+    report = profiling.format_report(profiling.report())
+    print(report)
+    window = tk.Toplevel(root)
+    window.title("Search profile")
+    text = scrolledtext.ScrolledText(window, height=30, width=100, font=("Courier", 9))
+    text.insert(tk.END, report)
+    text.config(state=tk.DISABLED)
+    text.pack(fill=tk.BOTH, expand=True)
 
 def append_operator(op):
     text = search_entry.get()
@@ -164,6 +159,7 @@ button_frame.pack(pady=5)
 tk.Button(button_frame, text="AND", command=lambda: append_operator("AND")).pack(side=tk.LEFT, padx=5)
 tk.Button(button_frame, text="OR", command=lambda: append_operator("OR")).pack(side=tk.LEFT, padx=5)
 tk.Button(button_frame, text="NOT", command=lambda: append_operator("NOT")).pack(side=tk.LEFT, padx=5)
+tk.Button(button_frame, text="NEAR/5", command=lambda: append_operator("NEAR/5")).pack(side=tk.LEFT, padx=5)
 
 tk.Button(root, text="Search", command=search_resumes).pack(pady=5)
 folder_label = tk.Label(root, text=f"Folder: {RESUME_FOLDER}")
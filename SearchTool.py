@@ -1,27 +1,36 @@
 import os
-import re
-import fitz  # PyMuPDF for PDFs
-import docx
-import pptx
-import pandas as pd
 import subprocess
 import platform
+import threading
+import time
+import profiling
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.popup import Popup
 from kivy.core.window import Window
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.modalview import ModalView
 from kivy.graphics import Color, Rectangle
+from kivy.properties import NumericProperty, StringProperty
 from kivy.utils import get_color_from_hex
 from kivy.clock import Clock
 from functools import partial
+from text_cache import TextCache
+from search_index import SearchIndex
+from folder_search import search_folder
+from query import compile_query, QuerySyntaxError
+from walker import walk_files
+from watcher import FolderWatcher
+from snippets import format_hit
+from dedup import find_duplicates, group_duplicates
 
 # Set theme colors
 THEME = {
@@ -40,113 +49,19 @@ RESULT_ITEM_COLORS = {
 }
 
 #RESUME_FOLDER = "Resume_Download"
-
-def extract_text_from_pdf(filepath):
-    text = ""
-    try:
-        doc = fitz.open(filepath)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-    return text
-
-def extract_text_from_docx(filepath):
-    try:
-        doc = docx.Document(filepath)
-        return "\n".join([para.text for para in doc.paragraphs])
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_pptx(filepath):
-    try:
-        presentation = pptx.Presentation(filepath)
-        text = []
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text.append(shape.text)
-        return "\n".join(text)
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_excel(filepath):
-    try:
-        df = pd.read_excel(filepath, sheet_name=None)
-        text = "\n".join([df[sheet].to_string() for sheet in df])
-        return text
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_txt(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-            return file.read()
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_csv(filepath):
-    try:
-        df = pd.read_csv(filepath)
-        return df.to_string()
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text(filepath):
-    ext = filepath.split(".")[-1].lower()
-    if ext == "pdf":
-        return extract_text_from_pdf(filepath)
-    elif ext == "docx":
-        return extract_text_from_docx(filepath)
-    elif ext == "pptx":
-        return extract_text_from_pptx(filepath)
-    elif ext in ["xls", "xlsx"]:
-        return extract_text_from_excel(filepath)
-    elif ext == "txt":
-        return extract_text_from_txt(filepath)
-    elif ext == "csv":
-        return extract_text_from_csv(filepath)
-    elif ext == "rtf":
-        try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
-        except Exception as e:
-            print(f"Error reading {filepath}: {e}")
-            return ""
-    elif ext in ["json", "xml", "html", "htm", "md", "log"]:
-        return extract_text_from_txt(filepath)
-    else:
-        print(f"Unsupported format: {filepath}")
-        return ""
-
-def boolean_search(text, query, exact_match=False):
-    query = query.replace("AND", "&").replace("OR", "|").replace("NOT", "~")
-    words = re.findall(r'\w+', query)
-    
-    for word in words:
-        if exact_match:
-            # For exact match, look for word boundaries
-            pattern = r'\b' + re.escape(word) + r'\b'
-            if not re.search(pattern, text, re.IGNORECASE):
-                query = query.replace(word, "False")
-            else:
-                query = query.replace(word, "True")
-        else:
-            # For partial match
-            if word.lower() not in text.lower():
-                query = query.replace(word, "False")
-            else:
-                query = query.replace(word, "True")
-    
-    try:
-        return eval(query)
-    except:
-        return False
+TEXT_CACHE = TextCache()
+USE_SEARCH_INDEX = True  # Answer queries from the folder's inverted index
+RECURSIVE_SEARCH = True  # Also search subfolders
+INCLUDE_PATTERNS = []  # e.g. ["*.pdf", "2024/*"]; empty means every supported file
+EXCLUDE_PATTERNS = []  # e.g. ["Archive", "~$*"]; matching folders are skipped entirely
+WATCH_FOLDER = True  # Keep the chosen folder's cache/index up to date in the background
+RANK_RESULTS = True  # Order matches by relevance (BM25) once the search is done; needs the index
+GROUP_DUPLICATES = True  # Search identical files once and list them as one result
+MAX_RESULTS = 200  # With ranking, only the best this many matches are listed
+PROFILE_SEARCHES = False  # Time every file and stage of a search and show the report afterwards
+
+if PROFILE_SEARCHES:
+    profiling.enable()
 
 class ThemedButton(Button):
     def __init__(self, **kwargs):
@@ -177,13 +92,20 @@ class ThemedTextInput(TextInput):
         self.padding = [10, 10, 10, 10]
         self.cursor_width = 2
 
-class ResultItem(ButtonBehavior, BoxLayout):
-    def __init__(self, filename, **kwargs):
+class ResultItem(RecycleDataViewBehavior, ButtonBehavior, BoxLayout):
+    """
+    One visible row of ResultsList: the file (with how many identical
+    copies of it were found) and, below it, where the query matched in it.
+    Rows are recycled while scrolling, so all of this comes from the list's
+    data and hover is driven by the list.
+    """
+    filename = StringProperty('')
+    snippet = StringProperty('')
+    copies = NumericProperty(0)
+
+    def __init__(self, **kwargs):
         super(ResultItem, self).__init__(**kwargs)
-        self.orientation = 'horizontal'
-        self.size_hint_y = None
-        self.height = 50
-        self.filename = filename
+        self.orientation = 'vertical'
         # self.click_time = 0 # Original line, can be kept or removed if not used
         self.last_click = 0
         self.is_hovering = False # ADDED: Track hover state
@@ -203,7 +125,7 @@ class ResultItem(ButtonBehavior, BoxLayout):
 
         # Label setup (adjust as per your original if needed, ensure text shortening)
         self.label = ThemedLabel(
-            text=filename,
+            text=self.filename,
             size_hint_x=0.9,
             halign='left',
             valign='middle',
@@ -213,12 +135,45 @@ class ResultItem(ButtonBehavior, BoxLayout):
         self.label.bind(size=self.label.setter('text_size'))
         self.add_widget(self.label)
 
+        self.snippet_label = ThemedLabel(
+            text=self.snippet,
+            size_hint_x=0.9,
+            font_size='12sp',
+            italic=True,
+            halign='left',
+            valign='top',
+            shorten=True,
+            shorten_from='right'
+        )
+        self.snippet_label.bind(size=self.snippet_label.setter('text_size'))
+        self.add_widget(self.snippet_label)
+
         # MODIFIED: Bind ButtonBehavior events (ensure these are present)
         self.bind(on_press=self.on_item_press)
         self.bind(on_release=self.on_item_release)
 
-        # ADDED: Bind mouse hover events using Window
-        Window.bind(mouse_pos=self.on_mouse_pos) # Bind window mouse pos changes
+    def refresh_view_attrs(self, rv, index, data):
+        # The row now shows another file: drop the previous file's state
+        if rv.hovered is self:
+            rv.hovered = None
+        self.is_hovering = False
+        self.last_click = 0
+        self.bg_color.rgba = get_color_from_hex(self.normal_color_hex)
+        return super(ResultItem, self).refresh_view_attrs(rv, index, data)
+
+    def on_filename(self, instance, value):
+        self.update_label()
+
+    def on_copies(self, instance, value):
+        self.update_label()
+
+    def update_label(self):
+        if hasattr(self, 'label'):
+            self.label.text = self.filename + (f"  (+{self.copies} identical)" if self.copies else "")
+
+    def on_snippet(self, instance, value):
+        if hasattr(self, 'snippet_label'):
+            self.snippet_label.text = value
 
     # MODIFIED: Ensure update_rect updates the background and label text_size
     def update_rect(self, *args):
@@ -228,24 +183,15 @@ class ResultItem(ButtonBehavior, BoxLayout):
         if hasattr(self, 'label'):
              self.label.text_size = (self.width * 0.9, None)
 
-    # --- ADDED: New methods for hover handling ---
-    def on_mouse_pos(self, window, pos):
-        # Check if the mouse position is within the bounds of this widget
-        # Need to convert window coords to local widget coords
-        widget_pos = self.to_widget(*pos)
-        is_inside = self.collide_point(*widget_pos)
-
-        if self.is_hovering != is_inside:
-            # Hover state changed
-            self.is_hovering = is_inside
+    # --- Hover handling, called by ResultsList ---
+    def set_hover(self, is_inside):
+        self.is_hovering = is_inside
+        # Check state to avoid changing color if button is pressed down
+        if self.state == 'normal':
             if is_inside:
-                # Check state to avoid changing color if button is pressed down
-                if self.state == 'normal':
-                    self.on_enter()
+                self.on_enter()
             else:
-                # Check state to avoid changing color if button is pressed down
-                if self.state == 'normal':
-                    self.on_leave()
+                self.on_leave()
 
     def on_enter(self):
         """Called when mouse enters the widget area."""
@@ -315,6 +261,65 @@ class ResultItem(ButtonBehavior, BoxLayout):
             print(f"Error opening file '{self.filename}': {e}")
             ErrorPopup(message=f"Could not open file:\n{e}").open()
 
+class ResultsList(RecycleView):
+    """
+    Results pane that only creates widgets for the rows in view, so tens of
+    thousands of matches cost no more to show or scroll than a screenful.
+    A single Window mouse binding finds the row under the pointer among
+    those visible rows, instead of every row testing every mouse move.
+    """
+    def __init__(self, **kwargs):
+        super(ResultsList, self).__init__(**kwargs)
+        self.viewclass = ResultItem
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, 60),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+            spacing=5
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.details = {}  # filename -> (description of its first hit, number of identical copies)
+        self.hovered = None
+        Window.bind(mouse_pos=self.on_mouse_pos)
+
+    def set_items(self, filenames):
+        """Show filenames, in this order, with the details they were added with."""
+        self.hovered = None
+        self.data = [self.row(name, *self.details.get(name, ('', 0))) for name in filenames]
+
+    def add_items(self, items):
+        """Append (filename, snippet, copies) triples."""
+        for name, snippet, copies in items:
+            self.details[name] = (snippet, copies)
+        self.data.extend(self.row(*item) for item in items)
+
+    @staticmethod
+    def row(name, snippet, copies):
+        return {'filename': name, 'snippet': snippet, 'copies': copies}
+
+    def clear(self):
+        self.details = {}
+        self.set_items([])
+
+    def on_mouse_pos(self, window, pos):
+        row = None
+        # collide_point wants parent coordinates; to_widget gives our own (scrolled) ones
+        if self.get_root_window() is not None and self.collide_point(*self.to_parent(*self.to_widget(*pos))):
+            layout = self.layout_manager
+            layout_pos = layout.to_widget(*pos)
+            for child in layout.children:  # Only the rows currently in view
+                if child.collide_point(*layout_pos):
+                    row = child
+                    break
+        if row is not self.hovered:
+            if self.hovered is not None:
+                self.hovered.set_hover(False)
+            if row is not None:
+                row.set_hover(True)
+            self.hovered = row
+
 
 class CustomFileChooserListView(FileChooserListView):
     def __init__(self, **kwargs):
@@ -406,6 +411,27 @@ class ErrorPopup(Popup):
         
         self.content = content
 
+class ProfilePopup(Popup):
+    """Shows the profiling report of the last search (PROFILE_SEARCHES)."""
+    def __init__(self, report, **kwargs):
+        super(ProfilePopup, self).__init__(**kwargs)
+        self.title = "Search profile"
+        self.size_hint = (0.9, 0.8)
+        self.background = ''
+        self.background_color = get_color_from_hex('#ffffff')
+        self.title_color = get_color_from_hex(THEME['primary'])
+        self.separator_color = get_color_from_hex(THEME['primary'])
+
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+        content.add_widget(ThemedTextInput(text=report, readonly=True, font_name='RobotoMono-Regular',
+                                           font_size='12sp'))
+
+        btn = ThemedButton(text="OK", size_hint_y=None, height=50)
+        btn.bind(on_release=self.dismiss)
+        content.add_widget(btn)
+
+        self.content = content
+
 class ResumeSearchApp(App):
     def build(self):
         self.title = "Search Tool"
@@ -421,6 +447,11 @@ class ResumeSearchApp(App):
         # ---^^^--- END OF REPLACEMENT/ADDITION ---^^^---
 
         self.exact_match = False
+        self.watcher = None
+        self.start_watcher(self.resume_folder)
+        self.search_cancel = None
+        self.search_generation = 0
+        self.match_count = 0
         # Set window background color
         Window.clearcolor = get_color_from_hex(THEME['background'])
         
@@ -477,19 +508,22 @@ class ResumeSearchApp(App):
         main_layout.add_widget(match_layout)
         
         # Boolean operators
-        operators_layout = GridLayout(cols=3, size_hint_y=None, height=50, spacing=10)
+        operators_layout = GridLayout(cols=4, size_hint_y=None, height=50, spacing=10)
         
         btn_and = ThemedButton(text="AND")
         btn_or = ThemedButton(text="OR")
         btn_not = ThemedButton(text="NOT")
+        btn_near = ThemedButton(text="NEAR/5")
         
         btn_and.bind(on_release=lambda x: self.append_operator("AND"))
         btn_or.bind(on_release=lambda x: self.append_operator("OR"))
         btn_not.bind(on_release=lambda x: self.append_operator("NOT"))
+        btn_near.bind(on_release=lambda x: self.append_operator("NEAR/5"))
         
         operators_layout.add_widget(btn_and)
         operators_layout.add_widget(btn_or)
         operators_layout.add_widget(btn_not)
+        operators_layout.add_widget(btn_near)
         
         main_layout.add_widget(operators_layout)
         
@@ -535,12 +569,19 @@ class ResumeSearchApp(App):
         
         self.results_container = BoxLayout(orientation='vertical')
         
-        scroll_view = ScrollView()
-        self.results_layout = BoxLayout(orientation='vertical', size_hint_y=None, spacing=5)
-        self.results_layout.bind(minimum_height=self.results_layout.setter('height'))
+        # Status label doubles as the live progress counter and the result count
+        self.status_label = ThemedLabel(
+            text="",
+            size_hint_y=None,
+            height=40,
+            halign='left'
+        )
+        self.status_label.bind(size=self.status_label.setter('text_size'))
+        self.results_container.add_widget(self.status_label)
         
-        scroll_view.add_widget(self.results_layout)
-        self.results_container.add_widget(scroll_view)
+        # Only the rows in view are widgets, however many files match
+        self.results_list = ResultsList()
+        self.results_container.add_widget(self.results_list)
         
         results_card.add_widget(self.results_container)
         main_layout.add_widget(results_card)
@@ -571,6 +612,18 @@ class ResumeSearchApp(App):
     def set_resume_folder(self, folder_path):
         self.resume_folder = folder_path
         self.folder_label.text = f"Folder: {self.resume_folder}"
+        self.start_watcher(folder_path)
+    
+    def start_watcher(self, folder):
+        """Watch folder (instead of the previous one) so searches find its index ready."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if WATCH_FOLDER and os.path.isdir(folder):
+            index = SearchIndex(folder) if USE_SEARCH_INDEX else None
+            self.watcher = FolderWatcher(
+                folder, TEXT_CACHE, index, RECURSIVE_SEARCH, INCLUDE_PATTERNS, EXCLUDE_PATTERNS
+            ).start()
     
     def toggle_match_mode(self, instance):
         self.exact_match = not self.exact_match
@@ -584,63 +637,137 @@ class ResumeSearchApp(App):
         if not query:
             ErrorPopup(message="Please enter a search query.").open()
             return
+        try:
+            compile_query(query, self.exact_match)  # Reject malformed queries before touching any files
+        except QuerySyntaxError as e:
+            ErrorPopup(message=f"Invalid search query: {e}").open()
+            return
         
-        # Clear previous results
-        self.results_layout.clear_widgets()
-        
-        # Add a status label
-        status_label = ThemedLabel(
-            text=f"Searching with {'exact' if self.exact_match else 'partial'} matching...", 
-            size_hint_y=None, 
-            height=30
-        )
-        self.results_layout.add_widget(status_label)
+        # Cancel the search still running, if any; its late updates are ignored
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+        self.search_cancel = threading.Event()
+        self.search_generation += 1
+        self.match_count = 0
+        profiling.reset()
         
-        # Use Clock to prevent UI from freezing during search
-        Clock.schedule_once(partial(self.perform_search, query), 0.1)
+        # Clear previous results
+        self.results_list.clear()
+        self.status_label.text = f"Searching with {'exact' if self.exact_match else 'partial'} matching..."
+        self.status_label.color = get_color_from_hex(THEME['text'])
+        
+        # Search on a worker thread so the window stays responsive
+        threading.Thread(
+            target=self.perform_search,
+            args=(query, self.exact_match, self.resume_folder, self.search_generation, self.search_cancel),
+            daemon=True
+        ).start()
     
-    def perform_search(self, query, dt):
-        matching_files = []
+    def perform_search(self, query, exact_match, folder, generation, cancel):
+        """Runs on a worker thread; all UI updates are posted with Clock.schedule_once."""
         try:
-            if os.path.exists(self.resume_folder):
-                for file in os.listdir(self.resume_folder):
-                    filepath = os.path.join(self.resume_folder, file)
-                    if os.path.isfile(filepath):
-                        text = extract_text(filepath)
-                        if boolean_search(text, query, self.exact_match):
-                            matching_files.append(file)
+            if not os.path.exists(folder):
+                raise FileNotFoundError(f"Folder not found: {folder}")
+            watcher = self.watcher
+            index = None
+            ranking_index = None
+            if watcher is not None and watcher.folder == os.path.abspath(folder) and watcher.ready:
+                # Kept current in the background: no listing, no extraction
+                filepaths = watcher.files()
+                duplicates = watcher.duplicates(filepaths) if GROUP_DUPLICATES else {}
+                results = watcher.search(query, exact_match, filepaths, snippets=True, duplicates=duplicates)
+                ranking_index = watcher.index
             else:
-                raise FileNotFoundError(f"Folder not found: {self.resume_folder}")
+                filepaths = list(walk_files(folder, RECURSIVE_SEARCH, INCLUDE_PATTERNS, EXCLUDE_PATTERNS))
+                # Identical files (re-downloads, "(1)" copies) are read once
+                duplicates = find_duplicates(filepaths, TEXT_CACHE) if GROUP_DUPLICATES else {}
+                index = SearchIndex(folder) if USE_SEARCH_INDEX else None
+                results = search_folder(filepaths, query, exact_match, TEXT_CACHE, index, snippets=True,
+                                        duplicates=duplicates)
+                ranking_index = index
+            copies = {original: len(group) for original, group in group_duplicates(duplicates).items()}
+            total = len(filepaths)
+            ranked = None
+            started = last_post = time.monotonic()
+            scanned = found = 0
+            pending = []
+            try:
+                for path, matched, hits in results:
+                    if cancel.is_set():
+                        return
+                    scanned += 1
+                    if matched and path not in duplicates:  # Copies are counted on their original's row
+                        found += 1
+                        # Shown under the name: where the first term matched
+                        snippet = format_hit(hits[0]) if hits else ''
+                        pending.append((os.path.relpath(path, folder), snippet, copies.get(path, 0)))
+                    now = time.monotonic()
+                    # Batch updates to ~10 per second, but show the first hit right away
+                    if (matched and found == 1) or now - last_post >= 0.1 or scanned == total:
+                        rate = scanned / max(now - started, 1e-6)
+                        Clock.schedule_once(partial(self.show_progress, generation, pending, scanned, total, rate))
+                        pending = []
+                        last_post = now
+                if RANK_RESULTS and found and ranking_index is not None:
+                    ranked = [
+                        os.path.relpath(path, folder)
+                        for path, score in ranking_index.rank(query, exact_match, MAX_RESULTS, filepaths)
+                        if path not in duplicates
+                    ]
+            finally:
+                results.close()
+                if index is not None:
+                    index.close()
         except Exception as e:
-            self.results_layout.clear_widgets()
-            ErrorPopup(message=f"Error searching files: {str(e)}").open()
+            Clock.schedule_once(partial(self.search_failed, generation, str(e)))
             return
-        
-        # Clear the status label
-        self.results_layout.clear_widgets()
-        
-        if matching_files:
-            result_count = ThemedLabel(
-                text=f"Found {len(matching_files)} matching file(s)", 
-                size_hint_y=None, 
-                height=40,
-                halign='left',
-                color=get_color_from_hex(THEME['success'])
-            )
-            result_count.bind(size=result_count.setter('text_size'))
-            self.results_layout.add_widget(result_count)
-            
-            for filename in matching_files:
-                result_item = ResultItem(filename)
-                self.results_layout.add_widget(result_item)
+        Clock.schedule_once(partial(self.search_finished, generation, ranked))
+    
+    def show_progress(self, generation, items, scanned, total, rate, dt):
+        if generation != self.search_generation:
+            return  # Update from a cancelled search
+        self.results_list.add_items(items)
+        self.match_count += len(items)
+        self.status_label.text = (
+            f"Scanned {scanned}/{total} files ({rate:.1f} files/sec), "
+            f"{self.match_count} match(es) so far..."
+        )
+    
+    def search_finished(self, generation, ranked, dt):
+        if generation != self.search_generation:
+            return
+        if ranked is not None:
+            # Replace the live, unordered list with the best matches first
+            self.results_list.set_items(ranked)
+        if ranked is not None and len(ranked) < self.match_count:
+            self.status_label.text = f"Found {self.match_count} matching file(s), showing the best {len(ranked)}"
+            self.status_label.color = get_color_from_hex(THEME['success'])
+        elif self.match_count:
+            self.status_label.text = f"Found {self.match_count} matching file(s)"
+            self.status_label.color = get_color_from_hex(THEME['success'])
         else:
-            no_results = ThemedLabel(
-                text="No matching files found.", 
-                size_hint_y=None, 
-                height=40,
-                color=get_color_from_hex(THEME['accent'])
-            )
-            self.results_layout.add_widget(no_results)
+            self.status_label.text = "No matching files found."
+            self.status_label.color = get_color_from_hex(THEME['accent'])
+        if PROFILE_SEARCHES:
+            self.show_profile()
+
+    def show_profile(self):
+        report = profiling.format_report(profiling.report())
+        print(report)
+        ProfilePopup(report).open()
+    
+    def search_failed(self, generation, message, dt):
+        if generation != self.search_generation:
+            return
+        self.results_list.clear()
+        self.status_label.text = ""
+        ErrorPopup(message=f"Error searching files: {message}").open()
+    
+    def on_stop(self):
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+        if self.watcher is not None:
+            self.watcher.stop()
 
 if __name__ == "__main__":
     ResumeSearchApp().run()
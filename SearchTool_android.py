@@ -1,12 +1,10 @@
 # --- START OF FILE SearchTool.py ---
 
 import os
-import re
-import fitz  # PyMuPDF for PDFs
-import docx
-import pptx
-import pandas as pd
 import subprocess
+import threading
+import time
+import profiling
 # import platform # Replaced by kivy.utils.platform check below
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
@@ -15,15 +13,27 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 # from kivy.uix.filechooser import FileChooserListView # Removed
 from kivy.uix.popup import Popup
 from kivy.core.window import Window
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.modalview import ModalView
 from kivy.graphics import Color, Rectangle
+from kivy.properties import NumericProperty, StringProperty
 from kivy.utils import get_color_from_hex, platform # Import platform
 from kivy.clock import Clock
 from functools import partial
+from text_cache import TextCache
+from search_index import SearchIndex
+from folder_search import search_folder
+from query import compile_query, QuerySyntaxError
+from walker import walk_files
+from watcher import FolderWatcher
+from snippets import format_hit
+from dedup import find_duplicates, group_duplicates
 
 # ---vvv--- ADDED PLYER IMPORTS ---vvv---
 try:
@@ -62,151 +72,22 @@ RESULT_ITEM_COLORS = {
     'hover': '#A0B38C',   # Main Background Green (Theme secondary)
     'press': '#889877'    # Darker Green
 }
-
-# Function definitions (extract_text_from_..., boolean_search) remain the same
-# ... (Keep all extract_text functions and boolean_search as they were) ...
-def extract_text_from_pdf(filepath):
-    text = ""
-    try:
-        doc = fitz.open(filepath)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-    return text
-
-def extract_text_from_docx(filepath):
-    try:
-        doc = docx.Document(filepath)
-        return "\n".join([para.text for para in doc.paragraphs])
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_pptx(filepath):
-    try:
-        presentation = pptx.Presentation(filepath)
-        text = []
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text.append(shape.text)
-        return "\n".join(text)
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_excel(filepath):
-    try:
-        df = pd.read_excel(filepath, sheet_name=None)
-        text = "\n".join([df[sheet].to_string() for sheet in df])
-        return text
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_txt(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-            return file.read()
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text_from_csv(filepath):
-    try:
-        df = pd.read_csv(filepath)
-        return df.to_string()
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
-
-def extract_text(filepath):
-    ext = filepath.split(".")[-1].lower()
-    if ext == "pdf":
-        return extract_text_from_pdf(filepath)
-    elif ext == "docx":
-        return extract_text_from_docx(filepath)
-    elif ext == "pptx":
-        return extract_text_from_pptx(filepath)
-    elif ext in ["xls", "xlsx"]:
-        return extract_text_from_excel(filepath)
-    elif ext == "txt":
-        return extract_text_from_txt(filepath)
-    elif ext == "csv":
-        return extract_text_from_csv(filepath)
-    elif ext == "rtf":
-        try:
-            # Basic RTF handling (same as before)
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                content = file.read()
-                content = re.sub(r'\{\*?\\[^{}]+}|[{}]|\\\w+(\s?)|\\.\s?', '', content)
-                return content.strip()
-        except Exception as e:
-            print(f"Error reading RTF {filepath}: {e}")
-            return extract_text_from_txt(filepath) # Fallback
-    elif ext in ["json", "xml", "html", "htm", "md", "log"]:
-        return extract_text_from_txt(filepath)
-    else:
-        print(f"Unsupported format: {filepath}")
-        return "" # Return empty string for unsupported or failed extractions
-
-def boolean_search(text, query, exact_match=False):
-    # Using the more robust version from previous examples
-    processed_query = query.replace(" AND ", " & ").replace(" OR ", " | ").replace(" NOT ", " ~")
-    terms = re.findall(r'"[^"]+"|\b\w+\b', query)
-    term_results = {}
-
-    for term in terms:
-        original_term = term
-        is_phrase = term.startswith('"') and term.endswith('"')
-        if is_phrase:
-            term = term[1:-1]
-
-        if exact_match:
-            pattern = r'\b' + re.escape(term) + r'\b'
-        else:
-            pattern = re.escape(term)
-
-        found = bool(re.search(pattern, text, re.IGNORECASE))
-        term_results[original_term] = found
-
-    sorted_terms = sorted(term_results.keys(), key=len, reverse=True)
-    eval_string = processed_query
-    for term in sorted_terms:
-        # Replace term with its boolean value (True/False)
-        # Need careful replacement. Using regex to ensure whole word/phrase replacement might be safer,
-        # but simple replace often works if query structure is reasonable.
-        # Let's refine this slightly with word boundaries for standalone words
-        if term.startswith('"'):
-            # Replace quoted phrase directly
-            eval_string = eval_string.replace(term, str(term_results[term]))
-        else:
-            # Replace standalone word using regex for boundary matching
-            # This handles cases like 'on' vs 'ontology' better.
-            # Pattern explanation:
-            # (?<![\w&|~])  # Negative lookbehind: Not preceded by word char or operator symbol
-            # \b{term}\b   # The word itself with boundaries
-            # (?![\w&|~])   # Negative lookahead: Not followed by word char or operator symbol
-            # Note: This lookahead/behind might be too strict if operators are immediately next to words.
-            # Let's revert to simpler replacement for now, assuming spaces around terms/operators.
-            # If issues arise, refine the replacement logic.
-             eval_string = eval_string.replace(term, str(term_results[term]))
-
-
-    eval_string = eval_string.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
-
-    try:
-        # Basic validation
-        if not re.fullmatch(r'^[() TrueFalsenotandor\s]+$', eval_string):
-             print(f"Warning: Invalid characters in eval string: {eval_string}")
-             return False
-        # Evaluate
-        return bool(eval(eval_string, {'__builtins__': {}}, {'True': True, 'False': False}))
-    except Exception as e:
-        print(f"Error evaluating boolean query '{eval_string}' derived from '{query}': {e}")
-        return False
-
+TEXT_CACHE = TextCache()
+USE_SEARCH_INDEX = True  # Answer queries from the folder's inverted index
+RECURSIVE_SEARCH = True  # Also search subfolders
+INCLUDE_PATTERNS = []  # e.g. ["*.pdf", "2024/*"]; empty means every supported file
+EXCLUDE_PATTERNS = []  # e.g. ["Archive", "~$*"]; matching folders are skipped entirely
+WATCH_FOLDER = True  # Keep the chosen folder's cache/index up to date in the background
+GROUP_DUPLICATES = True  # Search identical files once and list them as one result
+RANK_RESULTS = True  # Order matches by relevance (BM25) once the search is done; needs the index
+MAX_RESULTS = 200  # With ranking, only the best this many matches are listed
+PROFILE_SEARCHES = False  # Time every file and stage of a search and show the report afterwards
+
+if PROFILE_SEARCHES:
+    profiling.enable()
+
+# Android cannot launch extra interpreter processes, so extract in-process there
+EXTRACT_JOBS = 1 if platform == 'android' else None
 
 # Themed Widgets (ThemedButton, ThemedLabel, ThemedTextInput) remain the same
 # ... (Keep these classes as they were) ...
@@ -243,13 +124,20 @@ class ThemedTextInput(TextInput):
 
 
 # ResultItem class (with hover effects and MODIFIED open_file)
-class ResultItem(ButtonBehavior, BoxLayout):
-    def __init__(self, filename, **kwargs):
+class ResultItem(RecycleDataViewBehavior, ButtonBehavior, BoxLayout):
+    """
+    One visible row of ResultsList: the file (with how many identical
+    copies of it were found) and, below it, where the query matched in it.
+    Rows are recycled while scrolling, so all of this comes from the list's
+    data and hover is driven by the list.
+    """
+    filename = StringProperty('')
+    snippet = StringProperty('')
+    copies = NumericProperty(0)
+
+    def __init__(self, **kwargs):
         super(ResultItem, self).__init__(**kwargs)
-        self.orientation = 'horizontal'
-        self.size_hint_y = None
-        self.height = 50
-        self.filename = filename
+        self.orientation = 'vertical'
         self.last_click = 0
         self.is_hovering = False
 
@@ -264,7 +152,7 @@ class ResultItem(ButtonBehavior, BoxLayout):
         self.bind(pos=self.update_rect, size=self.update_rect)
 
         self.label = ThemedLabel(
-            text=filename,
+            text=self.filename,
             size_hint_x=0.9,
             halign='left',
             valign='middle',
@@ -274,12 +162,44 @@ class ResultItem(ButtonBehavior, BoxLayout):
         self.label.bind(size=self.label.setter('text_size'))
         self.add_widget(self.label)
 
+        self.snippet_label = ThemedLabel(
+            text=self.snippet,
+            size_hint_x=0.9,
+            font_size='12sp',
+            italic=True,
+            halign='left',
+            valign='top',
+            shorten=True,
+            shorten_from='right'
+        )
+        self.snippet_label.bind(size=self.snippet_label.setter('text_size'))
+        self.add_widget(self.snippet_label)
+
         self.bind(on_press=self.on_item_press)
         self.bind(on_release=self.on_item_release)
 
-        # Only bind mouse hover events if not on Android/iOS (touch platforms)
-        if platform not in ('android', 'ios'):
-            Window.bind(mouse_pos=self.on_mouse_pos)
+    def refresh_view_attrs(self, rv, index, data):
+        # The row now shows another file: drop the previous file's state
+        if rv.hovered is self:
+            rv.hovered = None
+        self.is_hovering = False
+        self.last_click = 0
+        self.bg_color.rgba = get_color_from_hex(self.normal_color_hex)
+        return super(ResultItem, self).refresh_view_attrs(rv, index, data)
+
+    def on_filename(self, instance, value):
+        self.update_label()
+
+    def on_copies(self, instance, value):
+        self.update_label()
+
+    def update_label(self):
+        if hasattr(self, 'label'):
+            self.label.text = self.filename + (f"  (+{self.copies} identical)" if self.copies else "")
+
+    def on_snippet(self, instance, value):
+        if hasattr(self, 'snippet_label'):
+            self.snippet_label.text = value
 
     def update_rect(self, *args):
         self.bg_rect.pos = self.pos
@@ -287,19 +207,14 @@ class ResultItem(ButtonBehavior, BoxLayout):
         if hasattr(self, 'label'):
              self.label.text_size = (self.width * 0.9, None)
 
-    def on_mouse_pos(self, window, pos):
-         # This method should only be called if not on android/ios due to the bind condition
-        widget_pos = self.to_widget(*pos)
-        is_inside = self.collide_point(*widget_pos)
-
-        if self.is_hovering != is_inside:
-            self.is_hovering = is_inside
+    def set_hover(self, is_inside):
+        # Called by ResultsList, which only tracks the mouse off android/ios
+        self.is_hovering = is_inside
+        if self.state == 'normal':
             if is_inside:
-                if self.state == 'normal':
-                    self.on_enter()
+                self.on_enter()
             else:
-                if self.state == 'normal':
-                    self.on_leave()
+                self.on_leave()
 
     def on_enter(self):
         # This method is primarily for desktop hover effect
@@ -382,6 +297,68 @@ class ResultItem(ButtonBehavior, BoxLayout):
     # ---^^^--- END MODIFIED open_file ---^^^---
 
 
+class ResultsList(RecycleView):
+    """
+    Results pane that only creates widgets for the rows in view, so tens of
+    thousands of matches cost no more to show or scroll than a screenful.
+    On desktop, a single Window mouse binding finds the row under the
+    pointer among those visible rows.
+    """
+    def __init__(self, **kwargs):
+        super(ResultsList, self).__init__(**kwargs)
+        self.viewclass = ResultItem
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, 60),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+            spacing=3
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.details = {}  # filename -> (description of its first hit, number of identical copies)
+        self.hovered = None
+        # Only track mouse hover if not on Android/iOS (touch platforms)
+        if platform not in ('android', 'ios'):
+            Window.bind(mouse_pos=self.on_mouse_pos)
+
+    def set_items(self, filenames):
+        """Show filenames, in this order, with the details they were added with."""
+        self.hovered = None
+        self.data = [self.row(name, *self.details.get(name, ('', 0))) for name in filenames]
+
+    def add_items(self, items):
+        """Append (filename, snippet, copies) triples."""
+        for name, snippet, copies in items:
+            self.details[name] = (snippet, copies)
+        self.data.extend(self.row(*item) for item in items)
+
+    @staticmethod
+    def row(name, snippet, copies):
+        return {'filename': name, 'snippet': snippet, 'copies': copies}
+
+    def clear(self):
+        self.details = {}
+        self.set_items([])
+
+    def on_mouse_pos(self, window, pos):
+        row = None
+        # collide_point wants parent coordinates; to_widget gives our own (scrolled) ones
+        if self.get_root_window() is not None and self.collide_point(*self.to_parent(*self.to_widget(*pos))):
+            layout = self.layout_manager
+            layout_pos = layout.to_widget(*pos)
+            for child in layout.children:  # Only the rows currently in view
+                if child.collide_point(*layout_pos):
+                    row = child
+                    break
+        if row is not self.hovered:
+            if self.hovered is not None:
+                self.hovered.set_hover(False)
+            if row is not None:
+                row.set_hover(True)
+            self.hovered = row
+
+
 # ---vvv--- DELETED CustomFileChooserListView CLASS ---vvv---
 # ---vvv--- DELETED FolderChooserPopup CLASS ---vvv---
 
@@ -418,6 +395,28 @@ class ErrorPopup(Popup):
         self.content = content
 
 
+class ProfilePopup(Popup):
+    """Shows the profiling report of the last search (PROFILE_SEARCHES)."""
+    def __init__(self, report, **kwargs):
+        super(ProfilePopup, self).__init__(**kwargs)
+        self.title = "Search profile"
+        self.size_hint = (0.9, 0.8)
+        self.background = ''
+        self.background_color = get_color_from_hex('#ffffff')
+        self.title_color = get_color_from_hex(THEME['primary'])
+        self.separator_color = get_color_from_hex(THEME['primary'])
+
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+        content.add_widget(ThemedTextInput(text=report, readonly=True, font_name='RobotoMono-Regular',
+                                           font_size='12sp'))
+
+        btn = ThemedButton(text="OK", size_hint_y=None, height=50)
+        btn.bind(on_release=self.dismiss)
+        content.add_widget(btn)
+
+        self.content = content
+
+
 # Main App Class with Android modifications
 class ResumeSearchApp(App):
 
@@ -468,9 +467,13 @@ class ResumeSearchApp(App):
         # ---vvv--- MODIFIED FOLDER INITIALIZATION ---vvv---
         self.resume_folder = None # Start with no folder selected
         self.initial_folder_text = "No folder selected"
+        self.watcher = None # Started once a folder is chosen
         # ---^^^--- END MODIFY ---^^^---
 
         self.exact_match = False
+        self.search_cancel = None
+        self.search_generation = 0
+        self.result_names = []  # Matches of the current search, in arrival order
         Window.clearcolor = get_color_from_hex(THEME['background'])
 
         main_layout = BoxLayout(
@@ -512,16 +515,19 @@ class ResumeSearchApp(App):
         main_layout.add_widget(match_layout)
 
         # Boolean operators layout (remains the same)
-        operators_layout = GridLayout(cols=3, size_hint_y=None, height=50, spacing=10)
+        operators_layout = GridLayout(cols=4, size_hint_y=None, height=50, spacing=10)
         btn_and = ThemedButton(text="AND")
         btn_or = ThemedButton(text="OR")
         btn_not = ThemedButton(text="NOT")
+        btn_near = ThemedButton(text="NEAR/5")
         btn_and.bind(on_release=lambda x: self.append_operator("AND"))
         btn_or.bind(on_release=lambda x: self.append_operator("OR"))
         btn_not.bind(on_release=lambda x: self.append_operator("NOT"))
+        btn_near.bind(on_release=lambda x: self.append_operator("NEAR/5"))
         operators_layout.add_widget(btn_and)
         operators_layout.add_widget(btn_or)
         operators_layout.add_widget(btn_not)
+        operators_layout.add_widget(btn_near)
         main_layout.add_widget(operators_layout)
 
         # Folder selection layout
@@ -558,11 +564,13 @@ class ResumeSearchApp(App):
         results_card.add_widget(results_label)
 
         self.results_container = BoxLayout(orientation='vertical')
-        scroll_view = ScrollView()
-        self.results_layout = BoxLayout(orientation='vertical', size_hint_y=None, spacing=3) # Reduced spacing
-        self.results_layout.bind(minimum_height=self.results_layout.setter('height'))
-        scroll_view.add_widget(self.results_layout)
-        self.results_container.add_widget(scroll_view)
+        # Status label doubles as the live progress counter and the result count
+        self.status_label = ThemedLabel(text="", size_hint_y=None, height=40, halign='left')
+        self.status_label.bind(size=self.status_label.setter('text_size'))
+        self.results_container.add_widget(self.status_label)
+        # Only the rows in view are widgets, however many files match
+        self.results_list = ResultsList()
+        self.results_container.add_widget(self.results_list)
         results_card.add_widget(self.results_container)
         main_layout.add_widget(results_card)
 
@@ -627,11 +635,14 @@ class ResumeSearchApp(App):
             # A better check might involve trying os.listdir shortly after.
             # Let's proceed optimistically first.
             self.resume_folder = selected_path
+            self.start_watcher(selected_path)
             # Update label - show basename for readability
             self.folder_label.text = f"Folder: {os.path.basename(self.resume_folder)}"
             # Clear results when folder changes
-            self.results_layout.clear_widgets()
-            self.results_layout.add_widget(ThemedLabel(text="Folder selected. Ready to search.", size_hint_y=None, height=30))
+            self.results_list.clear()
+            self.status_label.italic = False
+            self.status_label.text = "Folder selected. Ready to search."
+            self.status_label.color = get_color_from_hex(THEME['text'])
             print(f"Selected folder set to: {self.resume_folder}")
             # Try a quick listdir to potentially catch immediate permission issues
             try:
@@ -648,6 +659,18 @@ class ResumeSearchApp(App):
             self.folder_label.text = f"Folder: {current_display}"
     # ---^^^--- END REPLACE ---^^^---
 
+    def start_watcher(self, folder):
+        """Watch folder (instead of the previous one) so searches find its index ready."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if WATCH_FOLDER and os.path.isdir(folder):
+            index = SearchIndex(folder) if USE_SEARCH_INDEX else None
+            self.watcher = FolderWatcher(
+                folder, TEXT_CACHE, index, RECURSIVE_SEARCH, INCLUDE_PATTERNS, EXCLUDE_PATTERNS,
+                jobs=EXTRACT_JOBS
+            ).start()
+
     def toggle_match_mode(self, instance):
         self.exact_match = not self.exact_match
         instance.text = "Exact Match" if self.exact_match else "Partial Match"
@@ -671,116 +694,170 @@ class ResumeSearchApp(App):
         if not query:
             ErrorPopup(message="Please enter a search query.").open()
             return
+        try:
+            compile_query(query, self.exact_match)  # Reject malformed queries before touching any files
+        except QuerySyntaxError as query_e:
+            ErrorPopup(message=f"Invalid search query:\n{query_e}").open()
+            return
 
-        self.results_layout.clear_widgets()
-
-        status_label = ThemedLabel(
-            text=f"Searching in '{os.path.basename(self.resume_folder)}' ({'exact' if self.exact_match else 'partial'})...",
-            size_hint_y=None,
-            height=30,
-            italic=True
-        )
-        self.results_layout.add_widget(status_label)
-
-        Clock.schedule_once(partial(self.perform_search, query), 0.1)
+        # Cancel the search still running, if any; its late updates are ignored
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+        self.search_cancel = threading.Event()
+        self.search_generation += 1
+        self.result_names = []
+        profiling.reset()
+
+        self.results_list.clear()
+        self.status_label.text = f"Searching in '{os.path.basename(self.resume_folder)}' ({'exact' if self.exact_match else 'partial'})..."
+        self.status_label.italic = True
+        self.status_label.color = get_color_from_hex(THEME['text'])
+
+        # Search on a worker thread so the UI stays responsive (and Android doesn't report ANR)
+        threading.Thread(
+            target=self.perform_search,
+            args=(query, self.exact_match, self.resume_folder, self.search_generation, self.search_cancel),
+            daemon=True
+        ).start()
     # ---^^^--- END MODIFY ---^^^---
 
-    # ---vvv--- MODIFIED perform_search METHOD (Error Handling) ---vvv---
-    def perform_search(self, query, dt):
-        matching_files = []
+    # ---vvv--- MODIFIED perform_search METHOD (runs on a worker thread) ---vvv---
+    def perform_search(self, query, exact_match, current_folder, generation, cancel):
+        """
+        Runs on a worker thread; all UI updates are posted with Clock.schedule_once.
+        """
         search_error = None # Variable to store potential error message
+        ranked = None # Best matches first, when ranking is possible
 
-        # --- ADD CHECK FOR FOLDER EXISTENCE AGAIN ---
-        if not self.resume_folder or not os.path.isdir(self.resume_folder):
-            search_error = f"Selected folder no longer exists or is invalid:\n{os.path.basename(self.resume_folder) if self.resume_folder else 'None'}"
-        else:
-            current_folder = self.resume_folder # Cache it in case it changes mid-search? Unlikely but safer.
+        # --- ADD PERMISSION ERROR HANDLING ---
+        try:
+            list_of_files = os.listdir(current_folder)
+        except PermissionError:
+            search_error = f"Permission denied to read folder:\n{os.path.basename(current_folder)}\nPlease grant storage access and select folder again."
+        except FileNotFoundError: # Handle case where folder disappears between check and listdir
+            search_error = f"Folder not found during search:\n{os.path.basename(current_folder)}"
+        except Exception as list_e: # Catch other listing errors
+             search_error = f"Error listing folder contents:\n{list_e}"
+
+        if not search_error: # Proceed only if listing succeeded
             try:
-                # --- ADD PERMISSION ERROR HANDLING ---
+                print(f"Found {len(list_of_files)} items in {os.path.basename(current_folder)}") # Debug
+                watcher = self.watcher
+                index = None
+                ranking_index = None
+                if watcher is not None and watcher.folder == os.path.abspath(current_folder) and watcher.ready:
+                    # Kept current in the background: no listing, no extraction
+                    readable_files = watcher.files()
+                    duplicates = watcher.duplicates(readable_files) if GROUP_DUPLICATES else {}
+                    results = watcher.search(query, exact_match, readable_files, snippets=True,
+                                             duplicates=duplicates)
+                    ranking_index = watcher.index
+                else:
+                    readable_files = []
+                    for filepath in walk_files(current_folder, RECURSIVE_SEARCH, INCLUDE_PATTERNS, EXCLUDE_PATTERNS):
+                        # Check that we can actually read it
+                        if os.access(filepath, os.R_OK):
+                            readable_files.append(filepath)
+                    # Identical files (re-downloads, "(1)" copies) are read once
+                    duplicates = find_duplicates(readable_files, TEXT_CACHE) if GROUP_DUPLICATES else {}
+                    index = SearchIndex(current_folder) if USE_SEARCH_INDEX else None
+                    results = search_folder(readable_files, query, exact_match, TEXT_CACHE, index, jobs=EXTRACT_JOBS,
+                                            snippets=True, duplicates=duplicates)
+                    ranking_index = index
+                copies = {original: len(group) for original, group in group_duplicates(duplicates).items()}
+
+                total = len(readable_files)
+                started = last_post = time.monotonic()
+                scanned = found = 0
+                pending = []
                 try:
-                    list_of_files = os.listdir(current_folder)
-                except PermissionError:
-                    search_error = f"Permission denied to read folder:\n{os.path.basename(current_folder)}\nPlease grant storage access and select folder again."
-                    list_of_files = []
-                except FileNotFoundError: # Handle case where folder disappears between check and listdir
-                    search_error = f"Folder not found during search:\n{os.path.basename(current_folder)}"
-                    list_of_files = []
-                except Exception as list_e: # Catch other listing errors
-                     search_error = f"Error listing folder contents:\n{list_e}"
-                     list_of_files = []
-
-
-                if not search_error: # Proceed only if listing succeeded
-                     print(f"Found {len(list_of_files)} items in {os.path.basename(current_folder)}") # Debug
-                     for file in list_of_files:
-                         filepath = os.path.join(current_folder, file)
-                         try:
-                             # Check if it's a file *and* if we can read it
-                             if os.path.isfile(filepath) and os.access(filepath, os.R_OK):
-                                 print(f"Processing: {file}") # Debug
-                                 text = extract_text(filepath)
-                                 if text is not None: # Check if extraction returned something (not None on error)
-                                     if boolean_search(text, query, self.exact_match):
-                                         matching_files.append(file)
-                             # else: # Optional: log skipped items
-                             #    if not os.path.isfile(filepath): print(f"Skipping non-file: {file}")
-                             #    elif not os.access(filepath, os.R_OK): print(f"Skipping non-readable: {file}")
-
-                         except Exception as process_e:
-                              print(f"Error processing file {file}: {process_e}")
-                              # Decide whether to stop search or just skip the file
-                              # search_error = f"Error processing file {file}: {process_e}" # Example: store last error
-                              # break # Example: stop on first file error
-
+                    for filepath, matched, hits in results:
+                        if cancel.is_set():
+                            return # A newer search replaced this one
+                        scanned += 1
+                        if matched and filepath not in duplicates: # None on timeout; copies are counted on their original's row
+                            found += 1
+                            # Shown under the name: where the first term matched
+                            snippet = format_hit(hits[0]) if hits else ''
+                            pending.append((os.path.relpath(filepath, current_folder), snippet, copies.get(filepath, 0)))
+                        now = time.monotonic()
+                        # Batch updates to ~10 per second, but show the first hit right away
+                        if (matched and found == 1) or now - last_post >= 0.1 or scanned == total:
+                            rate = scanned / max(now - started, 1e-6)
+                            Clock.schedule_once(partial(self.show_progress, generation, pending, scanned, total, rate))
+                            pending = []
+                            last_post = now
+                    if RANK_RESULTS and found and ranking_index is not None:
+                        ranked = [
+                            os.path.relpath(path, current_folder)
+                            for path, score in ranking_index.rank(query, exact_match, MAX_RESULTS, readable_files)
+                            if path not in duplicates
+                        ]
+                finally:
+                    results.close()
+                    if index is not None:
+                        index.close()
             except Exception as e:
-                # Catch other potential errors during search setup
+                # Catch other potential errors during the search
                 import traceback
                 traceback.print_exc()
-                search_error = f"Unexpected error during search setup:\n{e}"
-        # --- END MODIFICATIONS ---
+                search_error = f"Unexpected error during search:\n{e}"
+        print(f"Text cache: {TEXT_CACHE.hits} hits, {TEXT_CACHE.misses} misses") # Debug
 
+        if search_error:
+            Clock.schedule_once(partial(self.search_failed, generation, search_error))
+        else:
+            Clock.schedule_once(partial(self.search_finished, generation, ranked))
+    # ---^^^--- END MODIFY perform_search ---^^^---
 
-        # --- UI UPDATE (Clear status, show error or results) ---
-        self.results_layout.clear_widgets() # Clear status label
+    def show_progress(self, generation, items, scanned, total, rate, dt):
+        if generation != self.search_generation:
+            return # Update from a cancelled search
+        self.result_names.extend(name for name, snippet, copies in items)
+        self.results_list.add_items(items)
+        self.status_label.text = f"Scanned {scanned}/{total} files ({rate:.1f} files/sec), {len(self.result_names)} match(es) so far..."
 
-        if search_error:
-            ErrorPopup(message=search_error).open()
-            no_results = ThemedLabel(
-                text="Search failed. See error message.", # Generic message
-                size_hint_y=None,
-                height=40,
-                color=get_color_from_hex(THEME['accent'])
-            )
-            self.results_layout.add_widget(no_results)
-            return # Stop processing results
-
-        if matching_files:
-            result_count = ThemedLabel(
-                text=f"Found {len(matching_files)} matching file(s):",
-                size_hint_y=None,
-                height=40,
-                halign='left',
-                color=get_color_from_hex(THEME['success'])
-            )
-            result_count.bind(size=result_count.setter('text_size'))
-            self.results_layout.add_widget(result_count)
-
-            matching_files.sort() # Sort results alphabetically
-
-            for filename in matching_files:
-                result_item = ResultItem(filename=filename) # Pass filename correctly
-                self.results_layout.add_widget(result_item)
+    def search_finished(self, generation, ranked, dt):
+        if generation != self.search_generation:
+            return
+        self.status_label.italic = False
+        if self.result_names:
+            self.status_label.text = f"Found {len(self.result_names)} matching file(s):"
+            self.status_label.color = get_color_from_hex(THEME['success'])
+            # Results arrive in completion order; once the search is done, show
+            # the best matches first (or sort alphabetically without ranking)
+            if ranked is not None:
+                matched = set(self.result_names)
+                if len(ranked) < len(self.result_names):
+                    self.status_label.text = f"Found {len(self.result_names)} matching file(s), best {len(ranked)}:"
+                self.result_names = [name for name in ranked if name in matched]
+            else:
+                self.result_names.sort()
+            self.results_list.set_items(self.result_names)
         else:
-            no_results = ThemedLabel(
-                text="No matching files found.",
-                size_hint_y=None,
-                height=40,
-                color=get_color_from_hex(THEME['text']) # Use normal text color for 'not found'
-            )
-            self.results_layout.add_widget(no_results)
-        # --- END UI UPDATE ---
+            self.status_label.text = "No matching files found."
+        if PROFILE_SEARCHES:
+            self.show_profile()
 
-    # ---^^^--- END MODIFY perform_search ---^^^---
+    def show_profile(self):
+        report = profiling.format_report(profiling.report())
+        print(report)
+        ProfilePopup(report).open()
+
+    def search_failed(self, generation, message, dt):
+        if generation != self.search_generation:
+            return
+        ErrorPopup(message=message).open()
+        self.results_list.clear()
+        self.status_label.italic = False
+        self.status_label.text = "Search failed. See error message." # Generic message
+        self.status_label.color = get_color_from_hex(THEME['accent'])
+
+    def on_stop(self):
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+        if self.watcher is not None:
+            self.watcher.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,401 @@
+"""
+Reproducible benchmarks for the extractors and boolean_search.
+
+    python benchmark.py                       # small corpus, summary on stderr, JSON on stdout
+    python benchmark.py --files 50 --pages 20 -o bench.json
+    python benchmark.py --compare bench.json  # show the change against an earlier run
+
+A synthetic corpus (PDF, DOCX, PPTX, XLSX, CSV, TXT) is generated from a
+seeded word list, so the same arguments produce the same documents on every
+machine and commit. Each extractor and each query shape is then timed per
+file, and files/sec, MB/sec, p50/p95 latency and peak RSS are reported. Every
+phase runs in a freshly spawned process so its peak RSS is its own. The
+corpus is extracted once into a text cache before the query phases, which
+load it and then time (and measure the memory of) query evaluation alone.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FORMATS = ("pdf", "docx", "pptx", "xlsx", "csv", "txt")
+
+# Query shapes timed against the extracted text of the whole corpus. The
+# planted words occur in a known fraction of documents (see PLANTED).
+QUERY_SHAPES = {
+    "single_term": "python",
+    "and_3": "python AND java AND sql",
+    "or_5": "python OR java OR rust OR golang OR kotlin",
+    "not": "python AND NOT java",
+    "phrase": '"machine learning"',
+    "near": "python NEAR/5 sql",
+    "wildcard": "pyth* OR /ja[vw]a/",
+    "fuzzy": "pyhton~1 OR javscript~2",
+    "nested": '(python OR java) AND ("machine learning" OR sql) AND NOT cobol',
+    "absent": "zyzzogeton",
+}
+PLANTED = {
+    "python": 0.5, "java": 0.3, "sql": 0.4, "rust": 0.05, "golang": 0.05,
+    "kotlin": 0.1, "cobol": 0.02, "machine learning": 0.2,
+}
+
+_SYLLABLES = ["ka", "ri", "to", "men", "sa", "lo", "vin", "de", "ra", "pu", "el", "no", "qua", "ti", "bo"]
+
+
+def _vocabulary(rng, size=5000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def _paragraphs(rng, vocabulary, count, words_per_paragraph):
+    for _ in range(count):
+        words = [rng.choice(vocabulary) for _ in range(words_per_paragraph)]
+        yield " ".join(words).capitalize() + "."
+
+
+def _document(rng, vocabulary, pages, words_per_page):
+    """Return a list of pages, each a list of paragraphs, with PLANTED terms mixed in."""
+    doc = [list(_paragraphs(rng, vocabulary, 4, words_per_page // 4)) for _ in range(pages)]
+    for term, fraction in PLANTED.items():
+        if rng.random() < fraction:
+            page = rng.choice(doc)
+            i = rng.randrange(len(page))
+            page[i] = f"{page[i]} Experience with {term.title()} in production."
+    return doc
+
+
+def _write_pdf(path, doc):
+    from extractors import backend
+    fitz = backend("fitz")
+    with fitz.open() as pdf:
+        for paragraphs in doc:
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, 576, 806), "\n".join(paragraphs), fontsize=8)
+        pdf.save(path)
+
+
+def _write_docx(path, doc):
+    import docx
+    document = docx.Document()
+    for paragraphs in doc:
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def _write_pptx(path, doc):
+    import pptx
+    from pptx.util import Inches
+    presentation = pptx.Presentation()
+    layout = presentation.slide_layouts[6]  # Blank
+    for paragraphs in doc:
+        slide = presentation.slides.add_slide(layout)
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6))
+        box.text_frame.text = "\n".join(paragraphs)
+    presentation.save(path)
+
+
+def _rows(doc):
+    # Tabular formats get one row per sentence, split into a few columns.
+    for paragraphs in doc:
+        for paragraph in paragraphs:
+            words = paragraph.split()
+            step = max(len(words) // 4, 1)
+            yield [" ".join(words[i:i + step]) for i in range(0, step * 4, step)]
+
+
+def _write_xlsx(path, doc):
+    import pandas as pd
+    pd.DataFrame(list(_rows(doc)), columns=["a", "b", "c", "d"]).to_excel(path, index=False)
+
+
+def _write_csv(path, doc):
+    import pandas as pd
+    pd.DataFrame(list(_rows(doc)), columns=["a", "b", "c", "d"]).to_csv(path, index=False)
+
+
+def _write_txt(path, doc):
+    with open(path, "w", encoding="utf-8") as f:
+        for paragraphs in doc:
+            f.write("\n".join(paragraphs) + "\n\f\n")
+
+
+WRITERS = {
+    "pdf": _write_pdf, "docx": _write_docx, "pptx": _write_pptx,
+    "xlsx": _write_xlsx, "csv": _write_csv, "txt": _write_txt,
+}
+
+
+def generate_corpus(folder, files=10, pages=5, words_per_page=400, formats=FORMATS, seed=0):
+    """
+    Write files documents of each format into folder and return their paths
+    grouped by format. An existing corpus generated with the same parameters
+    is reused.
+    """
+    params = {"files": files, "pages": pages, "words_per_page": words_per_page,
+              "formats": list(formats), "seed": seed}
+    manifest = os.path.join(folder, "manifest.json")
+    try:
+        with open(manifest, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["params"] == params:
+            return saved["paths"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(folder, exist_ok=True)
+    vocabulary = _vocabulary(random.Random(seed))
+    paths = {}
+    for fmt in formats:
+        # One generator per format, so adding a format leaves the others unchanged.
+        rng = random.Random(f"{seed}-{fmt}")
+        paths[fmt] = []
+        for i in range(files):
+            path = os.path.join(folder, f"doc{i:04d}.{fmt}")
+            WRITERS[fmt](path, _document(rng, vocabulary, pages, words_per_page))
+            paths[fmt].append(path)
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "paths": paths}, f)
+    return paths
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def peak_rss_bytes():
+    # VmHWM belongs to this process's address space; ru_maxrss is carried
+    # over fork and exec, so a spawned child would report its parent's peak.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # KiB on Linux
+
+
+def _reset_peak_rss():
+    # Linux 4.0+: start VmHWM over from the current RSS, so setup done
+    # before the timed loop does not count towards the phase's peak.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _summary(latencies, nbytes, elapsed, **extra):
+    peak = peak_rss_bytes()
+    summary = {
+        "files": len(latencies),
+        "seconds": elapsed,
+        "files_per_sec": len(latencies) / elapsed if elapsed else None,
+        "mb_per_sec": nbytes / 1e6 / elapsed if elapsed else None,
+        "p50_ms": _percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": _percentile(latencies, 95) * 1000 if latencies else None,
+        "peak_rss_mb": peak / 1e6 if peak is not None else None,
+    }
+    summary.update(extra)
+    return summary
+
+
+def bench_extractor(fmt, paths, repeat=1):
+    """
+    Time extract_text on every file of one format; runs in its own process.
+    The first file includes the cold import of the format's backend, which
+    is also reported separately as import_seconds.
+    """
+    from extractors import extract_text, import_times
+
+    latencies = []
+    nbytes = chars = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            t = time.perf_counter()
+            text = extract_text(path)
+            latencies.append(time.perf_counter() - t)
+            nbytes += os.path.getsize(path)
+            chars += len(text or "")
+    return _summary(latencies, nbytes, time.perf_counter() - started, chars=chars,
+                    import_seconds=import_times())
+
+
+def fill_cache(paths, cache_path):
+    """Extract every file into the text cache at cache_path; runs in its own process."""
+    from extract_pool import extract_files
+    from text_cache import TextCache
+
+    cache = TextCache(cache_path)
+    try:
+        for _ in extract_files(paths, cache, jobs=1):
+            pass
+    finally:
+        cache.close()
+
+
+def bench_query(query, exact_match, paths, cache_path, repeat=1):
+    """
+    Time boolean_search of one query over the corpus text cached by
+    fill_cache; runs in its own process. Loading the texts and compiling the
+    query happen before the timed loop and are left out of its peak RSS.
+    """
+    from query import boolean_search
+    from text_cache import TextCache
+
+    cache = TextCache(cache_path)
+    try:
+        texts = [cache.get(path, os.stat(path)) or "" for path in paths]
+    finally:
+        cache.close()
+    boolean_search("", query, exact_match)  # Compile outside the timed loop
+    _reset_peak_rss()
+    latencies = []
+    matches = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            t = time.perf_counter()
+            matches += boolean_search(text, query, exact_match)
+            latencies.append(time.perf_counter() - t)
+    nbytes = sum(len(text.encode("utf-8")) for text in texts) * repeat
+    return _summary(latencies, nbytes, time.perf_counter() - started, matches=matches // repeat)
+
+
+def _in_fresh_process(func, *args):
+    # spawn, not fork: a forked child would report the parent's peak RSS.
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def run(args):
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="searchstring-bench-")
+    try:
+        t = time.perf_counter()
+        paths = generate_corpus(corpus_dir, args.files, args.pages, args.words_per_page, args.formats, args.seed)
+        print(f"Corpus ready in {time.perf_counter() - t:.1f}s: {corpus_dir}", file=sys.stderr)
+
+        report = {
+            "params": {
+                "files": args.files, "pages": args.pages, "words_per_page": args.words_per_page,
+                "formats": list(args.formats), "seed": args.seed, "repeat": args.repeat,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "commit": _git_commit(),
+            },
+            "extractors": {},
+            "queries": {},
+        }
+        for fmt in args.formats:
+            report["extractors"][fmt] = _in_fresh_process(bench_extractor, fmt, paths[fmt], args.repeat)
+            _print_row(f"extract {fmt}", report["extractors"][fmt])
+
+        all_paths = [path for fmt in args.formats for path in paths[fmt]]
+        cache_path = os.path.join(corpus_dir, "texts.sqlite")
+        if args.queries:
+            _in_fresh_process(fill_cache, all_paths, cache_path)
+        for shape in args.queries:
+            for exact_match in (False, True):
+                name = f"{shape}/{'exact' if exact_match else 'partial'}"
+                result = _in_fresh_process(bench_query, QUERY_SHAPES[shape], exact_match, all_paths, cache_path,
+                                           args.repeat)
+                result["query"] = QUERY_SHAPES[shape]
+                report["queries"][name] = result
+                _print_row(f"query {name}", result)
+        return report
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _print_row(name, result):
+    print(
+        f"{name:<28} {result['files_per_sec']:>9.1f} files/s {result['mb_per_sec']:>8.2f} MB/s"
+        f"  p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms"
+        + (f"  rss {result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else ""),
+        file=sys.stderr,
+    )
+
+
+def compare(baseline, report):
+    """Print files/sec and p95 of report relative to baseline, for entries in both."""
+    print(f"\nChange against {baseline['environment'].get('commit') or 'baseline'}:", file=sys.stderr)
+    for section, label in (("extractors", "extract"), ("queries", "query")):
+        for name, result in report[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old or not old.get("files_per_sec") or not old.get("p95_ms"):
+                continue
+            speed = result["files_per_sec"] / old["files_per_sec"] - 1
+            p95 = result["p95_ms"] / old["p95_ms"] - 1
+            print(f"{label + ' ' + name:<28} files/s {speed:+7.1%}  p95 {p95:+7.1%}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark text extraction and boolean search.")
+    parser.add_argument("--files", type=int, default=10, help="documents per format (default: 10)")
+    parser.add_argument("--pages", type=int, default=5, help="pages (slides, sheet blocks) per document")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--queries", nargs="+", choices=sorted(QUERY_SHAPES), default=list(QUERY_SHAPES))
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="generate (or reuse) the corpus here instead of a temporary folder")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", metavar="JSON", help="earlier report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
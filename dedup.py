@@ -0,0 +1,81 @@
+import os
+import hashlib
+
+HASH_CHUNK_BYTES = 1 << 20  # Read size while hashing; files are never read whole
+
+
+def file_digest(filepath):
+    """Return the blake2b digest (hex) of filepath's bytes, read in chunks, or None if unreadable."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+    except OSError as e:
+        print(f"Error hashing {filepath}: {e}")
+        return None
+    return digest.hexdigest()
+
+
+def _original_first(path):
+    # Re-downloads are usually the longer names: "cv (1).pdf", "Copy of cv.pdf".
+    return len(os.path.basename(path)), path
+
+
+def cached_digest(filepath, st, cache=None):
+    """Return file_digest(filepath), kept in cache (a TextCache) by path, size and mtime if given."""
+    digest = cache.get_digest(filepath, st) if cache is not None else None
+    if digest is None:
+        digest = file_digest(filepath)
+        if digest is not None and cache is not None:
+            cache.put_digest(filepath, st, digest)
+    return digest
+
+
+def originals(groups):
+    """Return {copy: original} for groups (lists) of identical files; see find_duplicates."""
+    duplicates = {}
+    for same in groups:
+        original, *copies = sorted(same, key=_original_first)
+        for copy in copies:
+            duplicates[copy] = original
+    return duplicates
+
+
+def find_duplicates(filepaths, cache=None):
+    """
+    Return {path: original} for the files in filepaths whose bytes are
+    identical to another's; the original of each group is the file with
+    the shortest name. Only files sharing their size with another are
+    hashed at all, and with a TextCache the digests are kept across runs
+    (keyed by path, size and mtime like the cached text). Empty files are
+    left alone: there is nothing to share.
+    """
+    by_size = {}
+    stats = {}
+    for path in filepaths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_size:
+            by_size.setdefault(st.st_size, []).append(path)
+            stats[path] = st
+
+    by_digest = {}
+    for paths in by_size.values():
+        if len(paths) < 2:
+            continue
+        for path in paths:
+            digest = cached_digest(path, stats[path], cache)
+            if digest is not None:
+                by_digest.setdefault(digest, []).append(path)
+    return originals(by_digest.values())
+
+
+def group_duplicates(duplicates):
+    """Turn {copy: original} into {original: [copies]}, copies sorted."""
+    groups = {}
+    for copy, original in sorted(duplicates.items()):
+        groups.setdefault(original, []).append(copy)
+    return groups
@@ -0,0 +1,423 @@
+import os
+import sys
+import time
+import queue
+import pickle
+import collections
+import struct
+import importlib
+import itertools
+import threading
+import subprocess
+
+import profiling
+
+DEFAULT_TIMEOUT = 60.0  # Seconds one file may take before its worker is killed
+MAX_CACHED_CHARS = 32 * 1024 * 1024  # Larger texts are matched as a stream, never held whole
+_HEADER = struct.Struct("!Q")
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+_DONE = object()
+
+# Workers are plain interpreter subprocesses rather than multiprocessing
+# children: with the spawn start method multiprocessing re-runs the calling
+# script, and importing Search.py or the Kivy apps would open a window in
+# every worker.
+_WORKER_CMD = [
+    sys.executable, "-c",
+    f"import sys; sys.path.insert(0, {_MODULE_DIR!r}); import extract_pool; extract_pool._serve()",
+]
+
+
+def _send(stream, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _recv(stream):
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise EOFError
+    (length,) = _HEADER.unpack(header)
+    data = stream.read(length)
+    if len(data) < length:
+        raise EOFError
+    return pickle.loads(data)
+
+
+def _serve():
+    """Worker loop: run (module, function, argument) requests until EOF."""
+    # Keep the protocol on a private copy of stdout; anything the extractors
+    # print (including import-time warnings, which is why this module imports
+    # no parsing library itself) goes to stderr instead of corrupting the
+    # result stream.
+    out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    stdin = sys.stdin.buffer
+    try:
+        _send(out, ("ready", None))
+        while True:
+            try:
+                request = _recv(stdin)
+            except EOFError:
+                break
+            module, name, arg = request
+            try:
+                result = getattr(importlib.import_module(module), name)(arg)
+            except Exception as e:
+                print(f"Error processing {arg}: {e}")
+                result = None
+            _send(out, ("done", result))
+    except BrokenPipeError:
+        pass  # The parent went away; nothing left to report to
+
+
+class _Worker:
+    def __init__(self, results):
+        self.process = subprocess.Popen(_WORKER_CMD, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.task = None
+        self.started = None
+        self.ready = False
+        self.alive = True
+        threading.Thread(target=self._read, args=(results,), daemon=True).start()
+
+    def _read(self, results):
+        while True:
+            try:
+                kind, result = _recv(self.process.stdout)
+            except EOFError:
+                results.put((self, "exit", None))
+                return
+            results.put((self, kind, result))
+
+    def submit(self, task, func):
+        self.task = task
+        # The timeout runs from when the worker can actually start on the
+        # task, not from interpreter startup and imports.
+        self.started = time.monotonic() if self.ready else None
+        _send(self.process.stdin, (func.__module__, func.__name__, task))
+
+    def kill(self):
+        self.alive = False
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        self.alive = False
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def imap_unordered(func, items, jobs=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Yield (item, func(item)) for every item, in completion order, running func
+    in up to jobs worker processes. func must be a module-level function that
+    can be imported without side effects. items may be a lazy iterable; it is
+    consumed only as workers become free, so work starts before it is
+    exhausted.
+
+    An item still running after timeout seconds has its worker killed and is
+    yielded with a result of None, as is an item whose worker crashed.
+    """
+    items = iter(items)
+    jobs = jobs or default_jobs()
+    # Look ahead so that a single item does not pay for starting a process.
+    head = list(itertools.islice(items, 2))
+    items = itertools.chain(head, items)
+    if jobs <= 1 or len(head) <= 1 or getattr(sys, "frozen", False):
+        # Not worth starting processes (or no interpreter to start them with
+        # in a frozen build): run inline without a timeout.
+        for item in items:
+            yield item, func(item)
+        return
+
+    results = queue.Queue()
+    workers = []
+    exhausted = False
+    try:
+        while True:
+            # Hand out work to idle workers, starting new ones up to jobs.
+            while not exhausted:
+                idle = next((w for w in workers if w.task is None), None)
+                if idle is None and len(workers) >= jobs:
+                    break
+                item = next(items, _DONE)
+                if item is _DONE:
+                    exhausted = True
+                    break
+                if idle is None:
+                    idle = _Worker(results)
+                    workers.append(idle)
+                idle.submit(item, func)
+            busy = [w for w in workers if w.task is not None]
+            if not busy:
+                break
+
+            now = time.monotonic()
+            started = [w.started for w in busy if w.started is not None]
+            wait = min(started) + timeout - now if started else timeout
+            try:
+                worker, kind, result = results.get(timeout=max(wait, 0.01))
+            except queue.Empty:
+                worker = None
+            if worker is not None and kind == "ready":
+                worker.ready = True
+                if worker.task is not None:
+                    worker.started = time.monotonic()
+            elif worker is not None and worker.alive and worker.task is not None:
+                task, worker.task, worker.started = worker.task, None, None
+                if kind == "exit":
+                    print(f"Worker crashed while processing {task}")
+                    workers[workers.index(worker)] = _Worker(results)
+                yield task, result
+
+            # Kill and replace workers stuck past their deadline.
+            now = time.monotonic()
+            for i, stuck in enumerate(workers):
+                if stuck.started is not None and now - stuck.started > timeout:
+                    print(f"Timed out after {timeout:.0f}s: {stuck.task}")
+                    task = stuck.task
+                    stuck.kill()
+                    workers[i] = _Worker(results)
+                    yield task, None
+    finally:
+        for worker in workers:
+            if worker.task is not None:
+                worker.kill()
+            else:
+                worker.close()
+
+
+def extract_files(paths, cache=None, jobs=None, timeout=DEFAULT_TIMEOUT, with_pages=False):
+    """
+    Yield (path, text) for every path, reading cached text directly and
+    fanning the remaining files out to worker processes. text is None for
+    files that timed out or crashed their worker, and for a text over
+    MAX_CACHED_CHARS the {term: positions} of its words (see extract_task).
+    With with_pages, yield (path, text, page_starts) instead (see
+    extract_document).
+    """
+    hits = collections.deque()
+    stats = {}
+
+    def misses():
+        # paths may be a lazy walk: cache hits are handed back through hits
+        # as they are found and only misses go on to the workers.
+        for path in paths:
+            if cache is None:
+                yield path
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                yield path
+                continue
+            cached = cache.get(path, st, with_pages=True)
+            if cached is None:
+                stats[path] = st
+                yield path
+            else:
+                if profiling.enabled:
+                    profiling.record(_cached_stats(path, *cached))
+                hits.append((path,) + cached if with_pages else (path, cached[0]))
+
+    for path, result in imap_unordered(extract_task, misses(), jobs, timeout):
+        while hits:
+            yield hits.popleft()
+        text, page_starts, measured = result if result is not None else (None, None, _failed_stats(path))
+        profiling.record(measured)
+        if cache is not None and isinstance(text, str) and path in stats:
+            cache.put(path, text, stats[path], page_starts)
+        yield (path, text, page_starts) if with_pages else (path, text)
+    while hits:
+        yield hits.popleft()
+
+
+def _format_name(filepath):
+    from extractors import extractor_for
+
+    extractor = extractor_for(filepath, sniff_content=False)
+    return extractor.name if extractor is not None else "unknown"
+
+
+def _cached_stats(filepath, text, page_starts, match_seconds=0.0):
+    stats = profiling.new_stats(filepath, _format_name(filepath), cached=True)
+    stats["chars"] = len(text)
+    stats["chunks"] = len(page_starts) if page_starts is not None else 1
+    stats["match_seconds"] = match_seconds
+    return stats
+
+
+def _failed_stats(filepath):
+    if not profiling.enabled:
+        return None
+    stats = profiling.new_stats(filepath, _format_name(filepath))
+    stats["failed"] = True
+    return stats
+
+
+def extract_task(filepath):
+    """
+    Worker task for extract_files: (text, page_starts) as extract_document
+    returns them, plus the file's measurements when profiling (else None).
+    A text that grows past MAX_CACHED_CHARS is never joined or sent back:
+    its chunks are tokenized as they stream and (terms, None, stats) is
+    returned instead, terms being what search_index.tokenize_chunks gives.
+    """
+    from extractors import extractor_for, iter_text
+    from search_index import tokenize_chunks
+
+    extractor = extractor_for(filepath)
+    chunks = iter_text(filepath)
+    stats = None
+    if profiling.enabled:
+        stats = profiling.new_stats(filepath, _format_name(filepath))
+        chunks = profiling.timed_chunks(chunks, stats)
+    paged = extractor is not None and extractor.page_addressable
+    page_starts = [] if paged else None
+    kept = []
+    size = 0
+    for chunk in chunks:
+        if paged:
+            page_starts.append(size)
+        kept.append(chunk)
+        size += len(chunk)
+        if size > MAX_CACHED_CHARS:
+            return tokenize_chunks(itertools.chain(kept, chunks)), None, stats
+    return "".join(kept), page_starts, stats
+
+
+def match_file(request):
+    """
+    Worker task: stream the file's text into the query and stop reading as
+    soon as the result is known. Returns (matched, text, page_starts, hits,
+    stats): text is the full extracted text if the whole file had to be read
+    (and is small enough to cache), else None, and page_starts its page
+    offsets for paged formats. When snippets are requested and the file
+    matched, hits lists the Hits found in the text read, else it is None.
+    stats holds the file's measurements when profiling, else None.
+    """
+    from extractors import extractor_for, extract_text
+    from query import compile_query, match_chunks
+    from snippets import HitCollector, latin1_to_utf8
+
+    filepath, query, exact_match, snippets = request
+    compiled = compile_query(query, exact_match)
+    extractor = extractor_for(filepath)
+    options = {}
+    if extractor is not None and extractor.plain_text and compiled.latin1_safe:
+        # Mapped text scanned byte for byte; only cacheable if it was ASCII.
+        options["encoding"] = "latin-1"
+    if extractor is None:
+        text_chunks = iter([extract_text(filepath)])
+    else:
+        text_chunks = extractor.iter_text(filepath, **options)
+    stats = None
+    if profiling.enabled:
+        stats = profiling.new_stats(filepath, extractor.name if extractor is not None else "unknown")
+        text_chunks = profiling.timed_chunks(text_chunks, stats)
+        started = time.perf_counter()
+    paged = extractor is not None and extractor.page_addressable
+    collector = None
+    if snippets:
+        collector = HitCollector(compiled, paged, decode=latin1_to_utf8 if options else None)
+    chunks = []
+    page_starts = [] if paged else None
+    kept = 0
+    keep = True
+
+    def record():
+        nonlocal kept, keep
+        for chunk in text_chunks:
+            if collector is not None:
+                collector.feed(chunk)
+            if paged:
+                page_starts.append(kept)
+            if keep:
+                kept += len(chunk)
+                keep = kept <= MAX_CACHED_CHARS and (not options or chunk.isascii())
+                if keep:
+                    chunks.append(chunk)
+                else:
+                    chunks.clear()
+            yield chunk
+
+    matched, read_all = match_chunks(compiled, record())
+    hits = collector.finish() if collector is not None and matched else None
+    if stats is not None:
+        # Whatever was not spent producing chunks went to matching them
+        stats["match_seconds"] = time.perf_counter() - started - stats["extract_seconds"]
+        stats["read_all"] = read_all
+    if read_all and keep:
+        return matched, "".join(chunks), page_starts, hits, stats
+    return matched, None, None, hits, stats
+
+
+def search_files(paths, query, exact_match=False, cache=None, jobs=None, timeout=DEFAULT_TIMEOUT,
+                 snippets=False):
+    """
+    Yield (path, matched) for every path; paths may be a lazy iterable such
+    as a directory walk. Cached text is matched directly; other files are
+    matched in worker processes while being extracted, with early exit, and
+    cached when they had to be read in full. matched is None for files that
+    timed out or crashed their worker.
+
+    With snippets, yield (path, matched, hits) instead, hits being the Hits
+    (offsets, page and context, see snippets.py) of a matching file, taken
+    from its cached text or from the pages the worker read before deciding
+    the match; [] otherwise.
+    """
+    from query import compile_query
+    from snippets import find_hits
+
+    compiled = compile_query(query, exact_match)
+    hits = collections.deque()
+    stats = {}
+
+    def misses():
+        for path in paths:
+            st = None
+            if cache is not None:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    pass
+            cached = cache.get(path, st, with_pages=True) if st is not None else None
+            if cached is None:
+                stats[path] = st
+                yield path, query, exact_match, snippets
+                continue
+            text, page_starts = cached
+            started = time.perf_counter()
+            matched = compiled.matches(text)
+            if snippets:
+                hits.append((path, matched, find_hits(compiled, text, page_starts) if matched else []))
+            else:
+                hits.append((path, matched))
+            if profiling.enabled:
+                profiling.record(_cached_stats(path, text, page_starts, time.perf_counter() - started))
+
+    for request, result in imap_unordered(match_file, misses(), jobs, timeout):
+        while hits:
+            yield hits.popleft()
+        path = request[0]
+        if result is None:
+            profiling.record(_failed_stats(path))
+            yield (path, None, []) if snippets else (path, None)
+            continue
+        matched, text, page_starts, found, measured = result
+        profiling.record(measured)
+        if cache is not None and text is not None and stats.get(path) is not None:
+            cache.put(path, text, stats[path], page_starts)
+        yield (path, matched, found or []) if snippets else (path, matched)
+    while hits:
+        yield hits.popleft()
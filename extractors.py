@@ -0,0 +1,433 @@
+import os
+import re
+import csv
+import mmap
+import time
+import codecs
+import zipfile
+import posixpath
+import importlib
+
+# Shared by every frontend and by the extract_pool worker processes, so this
+# module must never import a GUI toolkit. The parsing libraries are imported
+# on first use (see backend()), so a process that only ever sees PDFs never
+# pays for pandas, and importing this module costs next to nothing.
+
+
+def _import_pymupdf():
+    try:
+        # "import fitz" prints a deprecation warning to stdout on current
+        # releases, which would corrupt the CLI's JSON/CSV output.
+        return importlib.import_module("pymupdf")
+    except ImportError:
+        return importlib.import_module("fitz")  # PyMuPDF < 1.24
+
+
+_BACKEND_LOADERS = {
+    "fitz": _import_pymupdf,  # PyMuPDF for PDFs
+    "etree": lambda: importlib.import_module("xml.etree.ElementTree"),  # DOCX and PPTX
+    "openpyxl": lambda: importlib.import_module("openpyxl"),
+    "pandas": lambda: importlib.import_module("pandas"),  # Only for legacy .xls
+}
+_backends = {}
+# Bump whenever an extractor change alters the text it gives for a file:
+# cached text and indexes written under another version are dropped.
+EXTRACTOR_VERSION = 1
+TEXT_CHUNK_BYTES = 1 << 20  # Window size for streaming plain-text files
+TEXT_CHUNK_CHARS = 1 << 16  # Batch size for spreadsheet and CSV rows
+XML_CHUNK_CHARS = 1 << 12  # Batch size for paragraphs streamed out of Office XML
+_import_seconds = {}
+
+
+def backend(name):
+    """Return the parsing library name (see _BACKEND_LOADERS), importing it on first use."""
+    module = _backends.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = _backends[name] = _BACKEND_LOADERS[name]()
+        _import_seconds[name] = time.perf_counter() - started
+    return module
+
+
+def import_times():
+    """Return {backend name: seconds its import took} for the backends loaded so far."""
+    return dict(_import_seconds)
+
+def iter_text_from_pdf(filepath):
+    # Yields one page at a time so a matcher can stop before the rest of a
+    # long document is parsed.
+    try:
+        with backend("fitz").open(filepath) as doc:
+            for page in doc:
+                yield page.get_text("text") + "\n"
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_pdf(filepath):
+    return "".join(iter_text_from_pdf(filepath))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_RELATIONSHIP = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+# mc:Fallback repeats the content of its mc:Choice (text boxes would come
+# twice), so its text is not read.
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+# Paragraph properties hold tab stops, not tabs.
+_DOCX_SKIPPED = {_MC_FALLBACK, _W + "pPr"}
+_DOCX_CHARS = {_W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+_DOCX_PART_RE = re.compile(r"word/(header|footer)(\d*)\.xml$")
+
+def _docx_parts(names):
+    # The body, then headers, then footers, each in number order
+    parts = []
+    for name in names:
+        match = _DOCX_PART_RE.match(name)
+        if match:
+            parts.append((match.group(1) == "footer", int(match.group(2) or 0), name))
+    return ["word/document.xml"] + [name for _, _, name in sorted(parts)]
+
+def _iter_xml_paragraphs(part, ns, chars, skipped_tags):
+    # WordprocessingML and DrawingML both keep text in <t> runs inside <p>
+    # paragraphs, each in its own namespace ns; chars maps elements that
+    # stand for a character (tabs, breaks) to it.
+    text_tag = ns + "t"
+    paragraph_tag = ns + "p"
+    pieces = []
+    size = 0
+    skipped = 0
+    for event, elem in backend("etree").iterparse(part, events=("start", "end")):
+        tag = elem.tag
+        if tag in skipped_tags:
+            skipped += 1 if event == "start" else -1
+        elif event == "start" or skipped:
+            continue
+        elif tag == text_tag:
+            if elem.text:
+                pieces.append(elem.text)
+                size += len(elem.text)
+        elif tag in chars:
+            pieces.append(chars[tag])
+        elif tag == paragraph_tag:
+            pieces.append("\n")
+            size += 1
+            elem.clear()  # Keeps memory flat on long documents
+            if size >= XML_CHUNK_CHARS:
+                yield "".join(pieces)
+                pieces = []
+                size = 0
+    if pieces:
+        yield "".join(pieces)
+
+def iter_text_from_docx(filepath):
+    # Streams the body, headers and footers straight out of the zip with an
+    # incremental parser, a few paragraphs per chunk, so no document model
+    # is built and a matcher can stop early. Table cells and text boxes are
+    # paragraphs like any other, one per line.
+    try:
+        with zipfile.ZipFile(filepath) as archive:
+            names = set(archive.namelist())
+            for name in _docx_parts(names):
+                if name in names:
+                    with archive.open(name) as part:
+                        yield from _iter_xml_paragraphs(part, _W, _DOCX_CHARS, _DOCX_SKIPPED)
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_docx(filepath):
+    return "".join(iter_text_from_docx(filepath))
+
+_PPTX_CHARS = {_A + "br": "\n"}
+_PPTX_SKIPPED = {_MC_FALLBACK}
+_SLIDE_RE = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+
+def _zip_rels(archive, part):
+    # {relationship id: (type, part name)} for the internal targets of part
+    folder, name = posixpath.split(part)
+    try:
+        data = archive.read(posixpath.join(folder, "_rels", name + ".rels"))
+    except KeyError:
+        return {}
+    rels = {}
+    for rel in backend("etree").fromstring(data).iter(_RELATIONSHIP):
+        if rel.get("TargetMode") != "External":
+            target = posixpath.normpath(posixpath.join(folder, rel.get("Target")))
+            rels[rel.get("Id")] = (rel.get("Type"), target.lstrip("/"))
+    return rels
+
+def _pptx_slides(archive, names):
+    # Presentation order comes from ppt/presentation.xml; file numbers only
+    # match it until slides are moved around.
+    rels = _zip_rels(archive, "ppt/presentation.xml")
+    slides = []
+    if "ppt/presentation.xml" in names:
+        presentation = backend("etree").fromstring(archive.read("ppt/presentation.xml"))
+        slides = [rels[slide.get(_R_ID)][1] for slide in presentation.iter(_P + "sldId")
+                  if slide.get(_R_ID) in rels]
+    if not slides:
+        numbered = []
+        for name in names:
+            match = _SLIDE_RE.match(name)
+            if match:
+                numbered.append((int(match.group(1)), name))
+        slides = [name for _, name in sorted(numbered)]
+    return [slide for slide in slides if slide in names]
+
+def iter_text_from_pptx(filepath):
+    # One chunk per slide, in presentation order, with its speaker notes;
+    # only slide and notes XML is read, never layouts, masters or media.
+    try:
+        with zipfile.ZipFile(filepath) as archive:
+            names = set(archive.namelist())
+            for slide in _pptx_slides(archive, names):
+                notes = [target for kind, target in _zip_rels(archive, slide).values()
+                         if kind.endswith("/notesSlide") and target in names]
+                pieces = []
+                for name in [slide] + notes:
+                    with archive.open(name) as part:
+                        pieces.extend(_iter_xml_paragraphs(part, _A, _PPTX_CHARS, _PPTX_SKIPPED))
+                yield "".join(pieces)
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_pptx(filepath):
+    return "".join(iter_text_from_pptx(filepath))
+
+def _rows_to_chunks(rows):
+    # Cells are joined with tabs and rows with newlines, in batches of about
+    # TEXT_CHUNK_CHARS, so a sheet of any size is matched a chunk at a time.
+    batch = []
+    size = 0
+    for row in rows:
+        line = "\t".join(str(value) for value in row if value is not None and value != "")
+        batch.append(line)
+        size += len(line) + 1
+        if size >= TEXT_CHUNK_CHARS:
+            yield "\n".join(batch) + "\n"
+            batch = []
+            size = 0
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+def iter_text_from_excel(filepath):
+    # .xlsx is read with openpyxl in read-only mode, which parses the sheet
+    # XML row by row instead of building every cell up front. Legacy .xls
+    # still goes through pandas (and xlrd) and is loaded whole.
+    try:
+        if filepath.lower().endswith(".xls"):
+            sheets = backend("pandas").read_excel(filepath, sheet_name=None, header=None)
+            for df in sheets.values():
+                yield from _rows_to_chunks(df.itertuples(index=False))
+            return
+        # Opened here rather than by name: openpyxl rejects names without an
+        # .xlsx/.xlsm extension, and sniffed workbooks may have none.
+        with open(filepath, "rb") as file:
+            workbook = backend("openpyxl").load_workbook(file, read_only=True, data_only=True)
+            try:
+                for sheet in workbook.worksheets:
+                    yield from _rows_to_chunks(sheet.iter_rows(values_only=True))
+            finally:
+                workbook.close()
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_excel(filepath):
+    return "".join(iter_text_from_excel(filepath))
+
+def iter_text_from_txt(filepath, encoding="utf-8", chunk_bytes=TEXT_CHUNK_BYTES):
+    # Maps the file and decodes one window at a time, so a multi-GB log is
+    # never held in memory as a single str and a matcher can stop early.
+    # The incremental decoder keeps characters split across windows intact.
+    try:
+        with open(filepath, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return  # Empty files cannot be mapped
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+                for start in range(0, len(mapped), chunk_bytes):
+                    yield decoder.decode(mapped[start:start + chunk_bytes])
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_txt(filepath):
+    return "".join(iter_text_from_txt(filepath))
+
+def iter_text_from_csv(filepath):
+    try:
+        with open(filepath, 'r', encoding='utf-8', errors='ignore', newline='') as file:
+            yield from _rows_to_chunks(csv.reader(file))
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+
+def extract_text_from_csv(filepath):
+    return "".join(iter_text_from_csv(filepath))
+
+def extract_text_from_rtf(filepath):
+    try:
+        # Basic RTF handling (same as before)
+        with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
+            content = file.read()
+            content = re.sub(r'\{\*?\\[^{}]+}|[{}]|\\\w+(\s?)|\\.\s?', '', content)
+            return content.strip()
+    except Exception as e:
+        print(f"Error reading RTF {filepath}: {e}")
+        return extract_text_from_txt(filepath) # Fallback
+
+class Extractor:
+    """
+    How to get text out of one file format, and what a scheduler may assume
+    about it:
+
+    streaming         iter_text() yields the text in several chunks, so a
+                      matcher can stop reading before the end of the file
+    page_addressable  those chunks are pages (or slides), in order
+    estimate_cost()   rough extraction time in seconds for a file of a given
+                      size, from fixed_cost plus seconds_per_mb (see
+                      benchmark.py for where the numbers come from)
+
+    plain_text        the file is text read straight from disk; iter_text()
+                      accepts encoding="latin-1" for a byte-for-byte decode
+                      when every query term is ASCII
+
+    magic lists byte prefixes identifying the format and zip_prefix the part
+    names inside an Office Open XML zip, for files whose extension is
+    missing or unknown.
+    """
+
+    def __init__(self, name, extensions, extract, iter_chunks=None, page_addressable=False,
+                 plain_text=False, magic=(), zip_prefix=None, fixed_cost=0.001, seconds_per_mb=0.01):
+        self.name = name
+        self.extensions = extensions
+        self._extract = extract
+        self._iter_chunks = iter_chunks
+        self.page_addressable = page_addressable
+        self.plain_text = plain_text
+        self.magic = magic
+        self.zip_prefix = zip_prefix
+        self.fixed_cost = fixed_cost
+        self.seconds_per_mb = seconds_per_mb
+
+    @property
+    def streaming(self):
+        return self._iter_chunks is not None
+
+    def extract(self, filepath):
+        return self._extract(filepath)
+
+    def iter_text(self, filepath, **options):
+        if self._iter_chunks is None:
+            yield self._extract(filepath)
+        else:
+            yield from self._iter_chunks(filepath, **options)
+
+    def estimate_cost(self, size):
+        return self.fixed_cost + self.seconds_per_mb * size / 1e6
+
+    def __repr__(self):
+        return f"Extractor({self.name})"
+
+_REGISTRY = []
+# Extension (lowercase, no dot) -> Extractor. Looking a file up here imports
+# nothing; the extractor loads its backend when it first runs.
+EXTRACTORS = {}
+
+def register(extractor):
+    """Add extractor to the registry; later registrations win for shared extensions."""
+    _REGISTRY.append(extractor)
+    for ext in extractor.extensions:
+        EXTRACTORS[ext] = extractor
+    SUPPORTED_EXTENSIONS.update(extractor.extensions)
+    return extractor
+
+SUPPORTED_EXTENSIONS = set()
+
+# Rough costs from benchmark.py runs, backend imports excluded; only their
+# ratios matter, for scheduling cheap files first.
+register(Extractor("pdf", ["pdf"], extract_text_from_pdf, iter_text_from_pdf, page_addressable=True,
+                   magic=[b"%PDF-"], fixed_cost=0.005, seconds_per_mb=1.0))
+register(Extractor("docx", ["docx"], extract_text_from_docx, iter_text_from_docx,
+                   zip_prefix="word/", fixed_cost=0.001, seconds_per_mb=0.03))
+register(Extractor("pptx", ["pptx"], extract_text_from_pptx, iter_text_from_pptx, page_addressable=True,
+                   zip_prefix="ppt/", fixed_cost=0.003, seconds_per_mb=0.02))
+register(Extractor("excel", ["xls", "xlsx"], extract_text_from_excel, iter_text_from_excel,
+                   zip_prefix="xl/", fixed_cost=0.015, seconds_per_mb=5.0))
+register(Extractor("csv", ["csv"], extract_text_from_csv, iter_text_from_csv,
+                   fixed_cost=0.0005, seconds_per_mb=0.02))
+register(Extractor("rtf", ["rtf"], extract_text_from_rtf, magic=[b"{\\rtf"], seconds_per_mb=0.05))
+register(Extractor("text", ["txt", "json", "xml", "html", "htm", "md", "log"], extract_text_from_txt,
+                   iter_text_from_txt, plain_text=True, fixed_cost=0.0001, seconds_per_mb=0.005))
+
+def sniff(filepath):
+    """Return the Extractor matching the first bytes of filepath, or None."""
+    try:
+        with open(filepath, "rb") as file:
+            head = file.read(8)
+    except OSError:
+        return None
+    if head.startswith(b"PK\x03\x04"):
+        # Office Open XML: Word, PowerPoint and Excel differ by part names
+        try:
+            with zipfile.ZipFile(filepath) as archive:
+                names = archive.namelist()
+        except (zipfile.BadZipFile, OSError):
+            return None
+        for extractor in _REGISTRY:
+            if extractor.zip_prefix and any(name.startswith(extractor.zip_prefix) for name in names):
+                return extractor
+        return None
+    for extractor in _REGISTRY:
+        if any(head.startswith(magic) for magic in extractor.magic):
+            return extractor
+    return None
+
+def extractor_for(filepath, sniff_content=True):
+    """Return the Extractor for filepath by extension, else by content, else None."""
+    extractor = EXTRACTORS.get(filepath.rsplit(".", 1)[-1].lower())
+    if extractor is None and sniff_content:
+        extractor = sniff(filepath)
+    return extractor
+
+def estimate_cost(filepath, size):
+    """Rough extraction time of filepath in seconds; no file is opened."""
+    extractor = extractor_for(filepath, sniff_content=False)
+    return extractor.estimate_cost(size) if extractor is not None else 0.0
+
+def extract_text(filepath):
+    extractor = extractor_for(filepath)
+    if extractor is None:
+        print(f"Unsupported format: {filepath}")
+        return "" # Return empty string for unsupported or failed extractions
+    return extractor.extract(filepath)
+
+def extract_document(filepath):
+    """
+    Return (text, page_starts): the text as extract_text() gives it and, for
+    page-addressable formats, the offset in it where each page begins
+    (else None).
+    """
+    extractor = extractor_for(filepath)
+    if extractor is None or not extractor.page_addressable:
+        return extract_text(filepath), None
+    pages = list(extractor.iter_text(filepath))
+    page_starts = []
+    offset = 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page)
+    return "".join(pages), page_starts
+
+def iter_text(filepath, **options):
+    """
+    Yield the text of filepath in chunks (pages for PDFs, fixed-size windows
+    for plain text). Concatenated, the chunks equal extract_text(filepath).
+    options are passed to streaming extractors (see Extractor).
+    """
+    extractor = extractor_for(filepath)
+    if extractor is None:
+        yield extract_text(filepath)
+    else:
+        yield from extractor.iter_text(filepath, **options)
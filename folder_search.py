@@ -0,0 +1,117 @@
+import os
+import time
+
+import profiling
+from dedup import group_duplicates
+from extract_pool import extract_files, search_files
+from extractors import estimate_cost
+from query import compile_query
+from snippets import cached_hits, find_hits
+
+
+def cheapest_first(filepaths, sizes=None):
+    """
+    Return filepaths ordered by estimated extraction cost, so quick files
+    (text, small documents) produce results while big spreadsheets and PDFs
+    are still being read. sizes maps path -> bytes; missing sizes are
+    taken from os.stat.
+    """
+    def cost(path):
+        size = sizes.get(path) if sizes else None
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+        return estimate_cost(path, size)
+
+    return sorted(filepaths, key=cost)
+
+
+def search_folder(filepaths, query, exact_match=False, cache=None, index=None, jobs=None, snippets=False,
+                  duplicates=None):
+    """
+    Yield (path, matched) for every file in filepaths as soon as it is
+    known, so callers can show results and progress while the search runs.
+    matched is None for files that could not be read in time. With
+    snippets, yield (path, matched, hits) as search_files does; files
+    answered from the index take their hits from the cached text.
+
+    With an index, files already indexed are answered from it straight away
+    and only new or modified files are extracted (and added to the index).
+    Without one every file is streamed through the matcher. Files given as
+    a list are extracted cheapest first; any other iterable (such as a
+    running directory walk) is consumed in order as it is produced.
+    Closing the generator stops the search and its worker processes.
+
+    duplicates maps files to an identical original (see
+    dedup.find_duplicates). Those files are neither read nor indexed; each
+    is yielded right after its original, with the original's result.
+    """
+    if not duplicates:
+        yield from _search_folder(filepaths, query, exact_match, cache, index, jobs, snippets)
+        return
+    copies = {os.path.abspath(original): group for original, group in group_duplicates(duplicates).items()}
+    if isinstance(filepaths, (list, tuple)):
+        originals = [path for path in filepaths if path not in duplicates]
+    else:
+        originals = (path for path in filepaths if path not in duplicates)
+    results = _search_folder(originals, query, exact_match, cache, index, jobs, snippets)
+    try:
+        for result in results:
+            yield result
+            for copy in copies.get(os.path.abspath(result[0]), []):
+                yield (copy,) + result[1:]
+    finally:
+        results.close()
+
+
+def _search_folder(filepaths, query, exact_match, cache, index, jobs, snippets):
+    compiled = compile_query(query, exact_match)
+    if index is None:
+        if isinstance(filepaths, (list, tuple)):
+            filepaths = cheapest_first(filepaths)
+        results = search_files(filepaths, query, exact_match, cache, jobs, snippets=snippets)
+        try:
+            yield from results
+        finally:
+            results.close()
+        return
+
+    filepaths = [os.path.abspath(path) for path in filepaths]
+    started = time.perf_counter()
+    stale = index.sync(filepaths)
+    profiling.add_stage("index sync", time.perf_counter() - started)
+    started = time.perf_counter()
+    hits = set(index.search(query, exact_match))
+    profiling.add_stage("index lookup", time.perf_counter() - started)
+    for path in filepaths:
+        if path in stale:
+            continue
+        matched = path in hits
+        if snippets:
+            yield path, matched, cached_hits(cache, path, compiled) if matched else []
+        else:
+            yield path, matched
+    sizes = {path: st.st_size for path, st in stale.items()}
+    extracted = extract_files(cheapest_first(stale, sizes), cache, jobs, with_pages=True)
+    try:
+        for path, text, page_starts in extracted:
+            started = time.perf_counter()
+            if text is not None:  # Else timed out or crashed: left stale, retried next search
+                index.add_document(path, text, stale[path])
+            profiling.add_stage("index update", time.perf_counter() - started)
+            started = time.perf_counter()
+            if isinstance(text, dict):
+                # Too large to send back whole: only its terms, now indexed
+                matched = path in index.search(query, exact_match)
+                text = None
+            else:
+                matched = compiled.matches(text) if text is not None else None
+            profiling.add_stage("matching", time.perf_counter() - started)
+            if snippets:
+                yield path, matched, find_hits(compiled, text, page_starts) if matched else []
+            else:
+                yield path, matched
+    finally:
+        extracted.close()
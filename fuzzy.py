@@ -0,0 +1,61 @@
+MAX_EDITS = 2  # Most typos a fuzzy term (word~n) may forgive
+
+
+class LevenshteinAutomaton:
+    """
+    Accepts the words within max_edits insertions, deletions or
+    substitutions of word. A state is the last row of the edit-distance
+    table against word, capped at max_edits + 1; states and transitions are
+    built the first time they are needed and then reused for every later
+    word, so testing a word costs about one dict lookup per character, and
+    stops at the first character after which no match is possible.
+
+    fullmatch() and search() make it usable where a term's compiled regex
+    is expected; a fuzzy term always matches whole words, so both are the
+    same.
+    """
+
+    def __init__(self, word, max_edits=1):
+        self.word = word
+        self.max_edits = max_edits
+        self._rows = []
+        self._ids = {}
+        self._next = []  # Per state: {char: next state id}, -1 when dead
+        self._accepting = []
+        self.start = self._state(tuple(min(i, max_edits + 1) for i in range(len(word) + 1)))
+
+    def _state(self, row):
+        state = self._ids.get(row)
+        if state is None:
+            if min(row) > self.max_edits:
+                return -1
+            state = self._ids[row] = len(self._rows)
+            self._rows.append(row)
+            self._next.append({})
+            self._accepting.append(row[-1] <= self.max_edits)
+        return state
+
+    def _step(self, state, char):
+        row = self._rows[state]
+        cap = self.max_edits + 1
+        new = [min(row[0] + 1, cap)]
+        for i, expected in enumerate(self.word):
+            new.append(min(new[i] + 1, row[i] + (expected != char), row[i + 1] + 1, cap))
+        next_state = self._next[state][char] = self._state(tuple(new))
+        return next_state
+
+    def fullmatch(self, text):
+        """Return True if text is within max_edits of word, else None."""
+        if abs(len(text) - len(self.word)) > self.max_edits:
+            return None
+        state = self.start
+        for char in text:
+            next_state = self._next[state].get(char)
+            if next_state is None:
+                next_state = self._step(state, char)
+            if next_state < 0:
+                return None
+            state = next_state
+        return True if self._accepting[state] else None
+
+    search = fullmatch
@@ -0,0 +1,108 @@
+import re
+
+try:
+    import ahocorasick  # pyahocorasick: optional C Aho-Corasick implementation
+except ImportError:
+    ahocorasick = None
+
+NON_WORD_RE = re.compile(r'\W+')
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == "_"
+
+
+class MultiMatcher:
+    """
+    Finds which of a fixed set of lowercase patterns occur in a document,
+    against a single lowercased copy of its text.
+
+    With pyahocorasick installed (it is in requirements.txt, and needed for
+    queries of 20-50 terms to cost about as much as one) the patterns are
+    compiled once into an Aho-Corasick automaton and every document is
+    scanned in one pass no matter how many patterns there are. Without it
+    each pattern is located with str.find on the shared copy, one pass per
+    pattern, which in CPython is still much faster than walking an
+    automaton in pure Python.
+
+    Patterns containing spaces are phrases: their words may be separated by
+    any run of non-word characters in the document. With exact_match a
+    pattern only counts when it is not part of a longer word.
+    """
+
+    def __init__(self, patterns, exact_match=False):
+        self.patterns = list(patterns)
+        self.exact_match = exact_match
+        self.full_mask = (1 << len(self.patterns)) - 1
+        self._normalize = any(" " in pattern for pattern in self.patterns)
+        self._automaton = None
+        if ahocorasick is not None and self.patterns:
+            automaton = ahocorasick.Automaton()
+            for i, pattern in enumerate(self.patterns):
+                automaton.add_word(pattern, (1 << i, pattern))
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    @property
+    def single_pass(self):
+        return self._automaton is not None
+
+    @property
+    def longest(self):
+        return max((len(pattern) for pattern in self.patterns), default=0)
+
+    def prepare(self, text):
+        """Return the lowercased (and, for phrases, space-normalized) copy to scan."""
+        text = text.lower()
+        if self._normalize:
+            text = NON_WORD_RE.sub(" ", text)
+        return text
+
+    def join(self, prepared, more):
+        """Append prepared text of the next chunk, keeping space runs collapsed."""
+        if self._normalize and prepared.endswith(" ") and more.startswith(" "):
+            more = more[1:]
+        return prepared + more
+
+    def _is_whole_word(self, text, start, end):
+        return (start == 0 or not _is_word_char(text[start - 1])) and (
+            end == len(text) or not _is_word_char(text[end])
+        )
+
+    def scan(self, prepared, lo=0, hi=None, found=0):
+        """
+        Return found plus a bit for every pattern occurring in prepared text
+        entirely within prepared[lo:hi], in one pass. Characters outside the
+        window are only consulted for exact-match word boundaries.
+        """
+        hi = len(prepared) if hi is None else hi
+        mask = found
+        if mask == self.full_mask or hi <= lo:
+            return mask
+        if self._automaton is None:
+            for i in range(len(self.patterns)):
+                if not mask >> i & 1 and self.contains(prepared, i, lo, hi):
+                    mask |= 1 << i
+            return mask
+        for end, (bits, pattern) in self._automaton.iter(prepared, lo, hi):
+            if bits & ~mask == 0:
+                continue
+            if self.exact_match and not self._is_whole_word(prepared, end + 1 - len(pattern), end + 1):
+                continue
+            mask |= bits
+            if mask == self.full_mask:
+                break  # Everything found; no need to read the rest
+        return mask
+
+    def contains(self, prepared, i, lo=0, hi=None):
+        """Return whether pattern i occurs in prepared[lo:hi]."""
+        pattern = self.patterns[i]
+        hi = len(prepared) if hi is None else hi
+        start = prepared.find(pattern, lo, hi)
+        if not self.exact_match:
+            return start != -1
+        while start != -1:
+            if self._is_whole_word(prepared, start, start + len(pattern)):
+                return True
+            start = prepared.find(pattern, start + 1, hi)
+        return False
@@ -0,0 +1,180 @@
+"""
+Optional instrumentation of searches: per-file extraction and matching
+time, bytes, chunks (pages for PDFs) and text length, plus time spent in
+stages such as index lookups, aggregated into a report of the slowest
+files, time per format and throughput.
+
+Off by default. enable() (or SEARCHSTRING_PROFILE=1 in the environment)
+turns it on here and in the extraction workers started afterwards, which
+send their measurements back with their results. While off, each file
+costs one flag check.
+"""
+import os
+import json
+import time
+import threading
+
+ENV_VAR = "SEARCHSTRING_PROFILE"
+SLOWEST_FILES = 10  # Files listed in the report
+
+enabled = os.environ.get(ENV_VAR) == "1"
+_records = []
+_stages = {}
+_lock = threading.Lock()
+
+
+def enable():
+    global enabled
+    enabled = True
+    os.environ[ENV_VAR] = "1"  # Inherited by worker processes
+
+
+def disable():
+    global enabled
+    enabled = False
+    os.environ.pop(ENV_VAR, None)
+
+
+def reset():
+    """Forget everything recorded so far, e.g. at the start of a new search."""
+    with _lock:
+        _records.clear()
+        _stages.clear()
+
+
+def new_stats(filepath, fmt, cached=False):
+    """Return an empty per-file record for filepath, to be filled in and passed to record()."""
+    try:
+        nbytes = os.path.getsize(filepath)
+    except OSError:
+        nbytes = 0
+    return {
+        "path": filepath,
+        "format": fmt,
+        "bytes": nbytes,
+        "cached": cached,
+        "chunks": 0,
+        "chars": 0,
+        "extract_seconds": 0.0,
+        "match_seconds": 0.0,
+        "read_all": True,
+        "failed": False,
+    }
+
+
+def timed_chunks(chunks, stats):
+    """Yield chunks, adding the time spent producing them, their count and their length to stats."""
+    iterator = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            stats["extract_seconds"] += time.perf_counter() - started
+            return
+        stats["extract_seconds"] += time.perf_counter() - started
+        stats["chunks"] += 1
+        stats["chars"] += len(chunk)
+        yield chunk
+
+
+def record(stats):
+    if enabled and stats is not None:
+        with _lock:
+            _records.append(stats)
+
+
+def add_stage(name, seconds):
+    """Add seconds to the total of a named stage (index lookups, matching cached text...)."""
+    if enabled:
+        with _lock:
+            _stages[name] = _stages.get(name, 0.0) + seconds
+
+
+def report(slowest=SLOWEST_FILES):
+    """Return the aggregated measurements as a JSON-serializable dict."""
+    with _lock:
+        records = list(_records)
+        stages = dict(_stages)
+    formats = {}
+    for stats in records:
+        fmt = formats.setdefault(stats["format"], {
+            "files": 0, "cached": 0, "bytes": 0, "chars": 0, "extract_seconds": 0.0, "match_seconds": 0.0,
+        })
+        fmt["files"] += 1
+        fmt["cached"] += stats["cached"]
+        for key in ("bytes", "chars", "extract_seconds", "match_seconds"):
+            fmt[key] += stats[key]
+    for fmt in formats.values():
+        seconds = fmt["extract_seconds"] + fmt["match_seconds"]
+        fmt["mb_per_second"] = fmt["bytes"] / 1e6 / seconds if seconds else None
+    extract_seconds = sum(stats["extract_seconds"] for stats in records)
+    match_seconds = sum(stats["match_seconds"] for stats in records)
+    nbytes = sum(stats["bytes"] for stats in records)
+    busy = extract_seconds + match_seconds
+
+    def total(stats):
+        return stats["extract_seconds"] + stats["match_seconds"]
+
+    from extractors import import_times
+
+    return {
+        "files": len(records),
+        "cached": sum(stats["cached"] for stats in records),
+        "failed": sum(stats["failed"] for stats in records),
+        "bytes": nbytes,
+        "extract_seconds": extract_seconds,
+        "match_seconds": match_seconds,
+        # Seconds are summed over files, so with several workers they add up
+        # to more than the wall time and this is the rate of one worker.
+        "mb_per_second": nbytes / 1e6 / busy if busy else None,
+        "formats": formats,
+        "stages": stages,
+        "imports": import_times(),
+        "slowest": sorted(records, key=total, reverse=True)[:slowest],
+    }
+
+
+def format_report(data):
+    """Render report() as text for a terminal or a popup."""
+    lines = [
+        f"{data['files']} files ({data['cached']} from cache, {data['failed']} failed),"
+        f" {data['bytes'] / 1e6:.1f} MB",
+        f"extraction {data['extract_seconds']:.2f}s, matching {data['match_seconds']:.2f}s"
+        + (f", {data['mb_per_second']:.1f} MB/s per worker" if data["mb_per_second"] else ""),
+        "",
+        f"{'format':<8} {'files':>6} {'MB':>8} {'extract':>9} {'match':>9} {'MB/s':>8}",
+    ]
+    for name, fmt in sorted(data["formats"].items(), key=lambda item: -item[1]["extract_seconds"]):
+        rate = f"{fmt['mb_per_second']:.1f}" if fmt["mb_per_second"] else "-"
+        lines.append(
+            f"{name:<8} {fmt['files']:>6} {fmt['bytes'] / 1e6:>8.1f} {fmt['extract_seconds']:>8.2f}s"
+            f" {fmt['match_seconds']:>8.2f}s {rate:>8}"
+        )
+    if data["stages"]:
+        lines.append("")
+        lines.extend(f"{name:<20} {seconds:8.3f}s" for name, seconds in sorted(data["stages"].items()))
+    if data["imports"]:
+        lines.append("")
+        lines.extend(f"import {name:<13} {seconds:8.3f}s" for name, seconds in sorted(data["imports"].items()))
+    if data["slowest"]:
+        lines.append("")
+        lines.append("slowest files:")
+        for stats in data["slowest"]:
+            if stats["cached"]:
+                note = " (cached)"
+            elif stats["failed"]:
+                note = " (failed)"
+            else:
+                note = "" if stats["read_all"] else " (stopped early)"
+            lines.append(
+                f"  {stats['extract_seconds'] + stats['match_seconds']:7.3f}s  {stats['path']}"
+                f"  [{stats['chunks']} chunks, {stats['chars']} chars]{note}"
+            )
+    return "\n".join(lines)
+
+
+def write_json(path, data=None):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report() if data is None else data, file, indent=2)
+        file.write("\n")
@@ -0,0 +1,702 @@
+import re
+import time
+from collections import deque
+from functools import lru_cache
+
+import profiling
+from fuzzy import LevenshteinAutomaton, MAX_EDITS
+from multimatch import MultiMatcher
+
+# Operators are upper-case only, as before: "and"/"or"/"not" are search terms.
+# A /regex/ must stand on its own so paths like "tcp/ip and/or" stay words.
+# Other punctuation is skipped, except |, & and a lone quote, which look like
+# operators and are rejected rather than quietly turned into an AND.
+QUERY_TOKEN_RE = re.compile(r'"[^"]*"|\(|\)|NEAR/\d+|(?<![\w/])/(?:[^/\\]|\\.)+/(?!\w)|[\w*?]+(?:~\d*)?|[|&"]')
+STRAY_TOKENS = {"|": "'|': use OR", "&": "'&': use AND", '"': 'unmatched \'"\''}
+WORD_RE = re.compile(r'\w+')
+NEAR_RE = re.compile(r'NEAR(?:/(\d+))?')
+NEAR_DISTANCE = 5  # Words apart allowed by a bare NEAR
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class Term:
+    """
+    A single word, or a quoted phrase of words separated by non-word
+    characters. A wildcard (java*, j?va) or /regex/ term has a pattern, a
+    compiled regex tested against single lowercase words, and literals,
+    substrings found in every word it matches. A fuzzy term (kubernets~1)
+    has a LevenshteinAutomaton as its pattern.
+    """
+
+    def __init__(self, words, phrase=False, pattern=None, literals=()):
+        self.words = words
+        self.phrase = phrase
+        self.pattern = pattern
+        self.literals = literals
+        self.key = " ".join(words)
+
+    def terms(self):
+        return [self]
+
+    def evaluate(self, lookup):
+        return lookup(self)
+
+    def evaluate_sets(self, lookup, universe):
+        return lookup(self)
+
+    def evaluate_partial(self, lookup):
+        return lookup(self)
+
+    def __repr__(self):
+        return f'Term("{self.key}")' if self.phrase else f"Term({self.key})"
+
+
+class Near:
+    """
+    Two terms at most distance words apart, in either order: "python NEAR/5
+    django". Positions are counted in word tokens from the end of one term
+    to the start of the other, so adjacent words are 1 apart. Evaluated as a
+    single leaf: lookups receive the Near itself.
+    """
+
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+        self.children = [left, right]
+        self.key = f"{left.key} NEAR/{distance} {right.key}"
+
+    def terms(self):
+        return [self.left, self.right]
+
+    def evaluate(self, lookup):
+        return lookup(self)
+
+    def evaluate_sets(self, lookup, universe):
+        return lookup(self)
+
+    def evaluate_partial(self, lookup):
+        return lookup(self)
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def terms(self):
+        return self.child.terms()
+
+    def evaluate(self, lookup):
+        return not self.child.evaluate(lookup)
+
+    def evaluate_sets(self, lookup, universe):
+        return universe() - self.child.evaluate_sets(lookup, universe)
+
+    def evaluate_partial(self, lookup):
+        value = self.child.evaluate_partial(lookup)
+        return None if value is None else not value
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def terms(self):
+        return [term for child in self.children for term in child.terms()]
+
+    def evaluate(self, lookup):
+        # all() stops at the first False, so later terms are never scanned.
+        return all(child.evaluate(lookup) for child in self.children)
+
+    def evaluate_sets(self, lookup, universe):
+        result = None
+        for child in self.children:
+            docs = child.evaluate_sets(lookup, universe)
+            result = docs if result is None else result & docs
+            if not result:
+                break
+        return result
+
+    def evaluate_partial(self, lookup):
+        values = [child.evaluate_partial(lookup) for child in self.children]
+        if False in values:
+            return False
+        return None if None in values else True
+
+    def __repr__(self):
+        return f"And({', '.join(map(repr, self.children))})"
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def terms(self):
+        return [term for child in self.children for term in child.terms()]
+
+    def evaluate(self, lookup):
+        return any(child.evaluate(lookup) for child in self.children)
+
+    def evaluate_sets(self, lookup, universe):
+        result = set()
+        for child in self.children:
+            result |= child.evaluate_sets(lookup, universe)
+        return result
+
+    def evaluate_partial(self, lookup):
+        values = [child.evaluate_partial(lookup) for child in self.children]
+        if True in values:
+            return True
+        return None if None in values else False
+
+    def __repr__(self):
+        return f"Or({', '.join(map(repr, self.children))})"
+
+
+class _Parser:
+    """
+    Recursive-descent parser. NEAR binds tightest, then NOT, then AND, then
+    OR; terms written next to each other without an operator are ANDed
+    together. "a NEAR b NEAR c" means a near b and b near c. In a word, *
+    stands for any run of word characters and ? for one; /.../ is a regex;
+    word~n matches words at most n typos away (word~ means word~1).
+    """
+
+    def __init__(self, query):
+        self.tokens = QUERY_TOKEN_RE.findall(query)
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("empty query")
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise QuerySyntaxError(f"unexpected '{self.tokens[self.pos]}'")
+        return node
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _or(self):
+        children = [self._and()]
+        while self._peek() == "OR":
+            self.pos += 1
+            children.append(self._and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def _and(self):
+        children = [self._not()]
+        while True:
+            token = self._peek()
+            if token == "AND":
+                self.pos += 1
+            elif token is None or token in (")", "OR"):
+                break
+            children.append(self._not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def _not(self):
+        if self._peek() == "NOT":
+            self.pos += 1
+            return Not(self._not())
+        return self._near()
+
+    def _near(self):
+        node = self._atom()
+        nears = []
+        while self._peek() is not None and NEAR_RE.fullmatch(self._peek()):
+            token = self._peek()
+            self.pos += 1
+            right = self._atom()
+            if not isinstance(node, Term) or not isinstance(right, Term):
+                raise QuerySyntaxError(f"{token} needs a word or phrase on each side")
+            distance = NEAR_RE.fullmatch(token).group(1)
+            distance = NEAR_DISTANCE if distance is None else int(distance)
+            if distance < 1:
+                raise QuerySyntaxError(f"{token}: the distance must be at least 1")
+            nears.append(Near(node, right, distance))
+            node = right
+        if not nears:
+            return node
+        return nears[0] if len(nears) == 1 else And(nears)
+
+    def _atom(self):
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("unexpected end of query")
+        self.pos += 1
+        if token == "(":
+            node = self._or()
+            if self._peek() != ")":
+                raise QuerySyntaxError("missing ')'")
+            self.pos += 1
+            return node
+        if token in STRAY_TOKENS:
+            raise QuerySyntaxError(STRAY_TOKENS[token])
+        if token in (")", "AND", "OR") or NEAR_RE.fullmatch(token):
+            raise QuerySyntaxError(f"unexpected '{token}'")
+        if token.startswith('"'):
+            words = WORD_RE.findall(token.lower())
+            if not words:
+                raise QuerySyntaxError(f"empty phrase {token}")
+            return Term(words, phrase=True)
+        if token.startswith("/"):
+            return _regex_term(token)
+        if "~" in token:
+            return _fuzzy_term(token)
+        if "*" in token or "?" in token:
+            return _wildcard_term(token)
+        return Term([token.lower()])
+
+
+def _wildcard_term(token):
+    key = token.lower()
+    if not WORD_RE.search(key):
+        raise QuerySyntaxError(f"wildcard {token} needs at least one letter")
+    pattern = "".join(r"\w*" if c == "*" else r"\w" if c == "?" else re.escape(c) for c in key)
+    literals = [run for run in re.split(r"[*?]+", key) if run]
+    return Term([key], pattern=re.compile(pattern), literals=literals)
+
+
+def _fuzzy_term(token):
+    word, edits = token.lower().split("~")
+    if not WORD_RE.fullmatch(word):
+        raise QuerySyntaxError(f"{token}: only plain words can be fuzzy")
+    edits = int(edits) if edits else 1
+    if not 1 <= edits <= MAX_EDITS:
+        raise QuerySyntaxError(f"{token}: allow between 1 and {MAX_EDITS} typos")
+    return Term([f"{word}~{edits}"], pattern=LevenshteinAutomaton(word, edits))
+
+
+def _regex_term(token):
+    try:
+        pattern = re.compile(token[1:-1], re.IGNORECASE)
+    except re.error as e:
+        raise QuerySyntaxError(f"invalid regex {token}: {e}")
+    return Term([token], pattern=pattern, literals=required_literals(token[1:-1]))
+
+
+def _skip_class(pattern, i):
+    """Return the index just past the [...] character class starting at pattern[i]."""
+    i += 1
+    if i < len(pattern) and pattern[i] == "^":
+        i += 1
+    if i < len(pattern) and pattern[i] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+_OCTAL = "01234567"
+
+
+def _skip_escape(pattern, i):
+    """Return the index just past the backslash escape starting at pattern[i]."""
+    c = pattern[i + 1:i + 2]
+    if c in _ESCAPE_DIGITS:
+        return i + 2 + _ESCAPE_DIGITS[c]
+    if c == "N" and pattern[i + 2:i + 3] == "{":
+        end = pattern.find("}", i)
+        return len(pattern) if end == -1 else end + 1
+    if c == "0":
+        # Octal: \0 plus up to two more octal digits
+        i += 2
+        for _ in range(2):
+            if pattern[i:i + 1] and pattern[i] in _OCTAL:
+                i += 1
+        return i
+    if c.isdigit():
+        digits = pattern[i + 1:i + 4]
+        if len(digits) == 3 and all(d in _OCTAL for d in digits):
+            return i + 4  # Octal \ooo
+        # Group reference \1 to \99
+        return i + 3 if pattern[i + 2:i + 3].isdigit() else i + 2
+    return i + 2
+
+
+def _skip_group(pattern, i):
+    """Return the index just past the (...) group starting at pattern[i]."""
+    depth = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def required_literals(pattern):
+    """
+    Return lowercase substrings that every match of the regex pattern
+    contains, to narrow down candidate words before testing them. Only
+    plain runs of word characters outside groups and classes are taken;
+    with alternation nothing is, which costs speed but never a match. An
+    escape (\\x41, \\101, \\d, \\.) ends a run and is skipped whole.
+    """
+    if "|" in pattern:
+        return []
+    literals = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        following = pattern[i + 1] if i + 1 < len(pattern) else ""
+        if c.isalnum() or c == "_":
+            if following in ("?", "*", "{"):
+                # May be absent or repeated: ends the run without joining it
+                literals.append(run)
+                run = ""
+            elif following == "+":
+                literals.append(run + c)
+                run = ""
+            else:
+                run += c
+            i += 1
+            continue
+        literals.append(run)
+        run = ""
+        if c == "\\":
+            i = _skip_escape(pattern, i)
+        elif c == "[":
+            i = _skip_class(pattern, i)
+        elif c == "(":
+            i = _skip_group(pattern, i)
+        elif c == "{":
+            end = pattern.find("}", i)
+            i = len(pattern) if end == -1 else end + 1
+        else:
+            i += 1
+    literals.append(run)
+    return [literal.lower() for literal in literals if literal]
+
+
+class CompiledQuery:
+    """
+    A query parsed once into an AST, reusable across documents. matches()
+    lowercases each document once and finds every term in a single pass
+    with the query's MultiMatcher; without the Aho-Corasick backend it falls
+    back to short-circuit evaluation, scanning for a term only when the
+    outcome still depends on it. NEAR operators and wildcard or regex terms
+    are decided on the words of the text; a NEAR only once its plain terms
+    are known to occur.
+    """
+
+    def __init__(self, query, exact_match=False):
+        self.query = query
+        self.exact_match = exact_match
+        self.root = _Parser(query).parse()
+        self.terms = list({term.key: term for term in self.root.terms()}.values())
+        plain = [term for term in self.terms if term.pattern is None]
+        self._bits = {term.key: i for i, term in enumerate(plain)}
+        self.nears = list({near.key: near for near in _nears(self.root)}.values())
+        self.patterns = [term for term in self.terms if term.pattern is not None]
+        # Built once per query; shared by every document this query is run on.
+        self.matcher = MultiMatcher([term.key for term in plain], exact_match)
+
+    def matches(self, text):
+        prepared = self.matcher.prepare(text)
+        if self.matcher.single_pass:
+            mask = self.matcher.scan(prepared)
+
+            def lookup(term):
+                return bool(mask >> self._bits[term.key] & 1)
+        else:
+            found = {}
+
+            def lookup(term):
+                if term.key not in found:
+                    found[term.key] = self.matcher.contains(prepared, self._bits[term.key])
+                return found[term.key]
+
+        if self.nears or self.patterns:
+            lookup = self._word_lookup(prepared, lookup)
+        return self.root.evaluate(lookup)
+
+    def _word_lookup(self, prepared, lookup):
+        """Extend a plain-term lookup to NEAR and pattern terms, reading the words of prepared at most once."""
+        scan = None
+
+        def word_lookup(node):
+            nonlocal scan
+            if isinstance(node, Term) and node.pattern is None:
+                return lookup(node)
+            if isinstance(node, Near) and not all(lookup(term) for term in node.terms() if term.pattern is None):
+                return False
+            if scan is None:
+                scan = WordScan(self.nears + self.patterns, self.exact_match)
+                scan.feed(prepared, final=True)
+            return scan.found(node)
+
+        return word_lookup
+
+    @property
+    def positive_terms(self):
+        """Unique terms that count towards a match, i.e. not under a NOT; used for snippets."""
+        return [node for node in self._positive_nodes() if isinstance(node, Term)]
+
+    @property
+    def scored_terms(self):
+        """positive_terms plus the NEAR pairs not under a NOT; used for ranking."""
+        return self._positive_nodes()
+
+    def _positive_nodes(self):
+        found = {}
+
+        def visit(node, negated):
+            if isinstance(node, (Term, Near)):
+                if not negated:
+                    found.setdefault(node.key, node)
+            elif isinstance(node, Not):
+                visit(node.child, not negated)
+                return
+            if isinstance(node, (Near, And, Or)):
+                for child in node.children:
+                    visit(child, negated)
+
+        visit(self.root, False)
+        return list(found.values())
+
+    @property
+    def latin1_safe(self):
+        """
+        Whether UTF-8 text decoded as latin-1 (one character per byte, no
+        validation) gives the same result as decoding it properly: true when
+        every term is a single ASCII word and, without exact_match, NEAR or
+        patterns, no word boundaries are checked. The multi-byte sequences of other characters
+        then never form or break an ASCII match (the only exceptions being
+        the few non-ASCII capitals that lowercase to ASCII, like the Kelvin
+        sign).
+        """
+        return not self.exact_match and not self.nears and not self.patterns and all(
+            term.key.isascii() and " " not in term.key for term in self.terms
+        )
+
+    def stream(self):
+        """Return a QueryStream for matching one document fed in chunks."""
+        return QueryStream(self)
+
+
+class QueryStream:
+    """
+    Matches a compiled query against a document that arrives in chunks
+    (pages, slides, rows...). feed() returns True or False as soon as the
+    terms seen so far decide the query, e.g. an OR satisfied on page one,
+    and None while it is still open; finish() gives the final answer.
+
+    A short tail of each chunk is carried into the next scan so that terms
+    straddling a chunk boundary are still found. Hits that touch the end of
+    the buffer are only accepted once the following character is known.
+    NEAR operators and pattern terms are followed word by word with a
+    WordScan.
+    """
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.matcher = compiled.matcher
+        self.mask = 0
+        self._carry = ""
+        self._dropped = False
+        self._keep = self.matcher.longest + 1
+        words = compiled.nears + compiled.patterns
+        self._words = WordScan(words, compiled.exact_match) if words else None
+
+    def _scan(self, buffer, final):
+        lo = 1 if self._dropped else 0
+        hi = len(buffer) if final else len(buffer) - 1
+        self.mask = self.matcher.scan(buffer, lo, hi, self.mask)
+
+    def _found(self, term):
+        if isinstance(term, Near) or term.pattern is not None:
+            return self._words.found(term)
+        return bool(self.mask >> self.compiled._bits[term.key] & 1)
+
+    def _lookup(self, term):
+        return True if self._found(term) else None
+
+    def feed(self, chunk):
+        if not chunk:
+            return None
+        prepared = self.matcher.prepare(chunk)
+        buffer = self.matcher.join(self._carry, prepared)
+        self._scan(buffer, final=False)
+        if self._words is not None:
+            self._words.feed(prepared)
+        if len(buffer) > self._keep:
+            self._carry = buffer[-self._keep:]
+            self._dropped = True
+        else:
+            self._carry = buffer
+        return self.compiled.root.evaluate_partial(self._lookup)
+
+    def finish(self):
+        self._scan(self._carry, final=True)
+        if self._words is not None:
+            self._words.feed("", final=True)
+        return self.compiled.root.evaluate(self._found)
+
+
+def _nears(node):
+    if isinstance(node, Near):
+        return [node]
+    if isinstance(node, Term):
+        return []
+    if isinstance(node, Not):
+        return _nears(node.child)
+    return [near for child in node.children for near in _nears(child)]
+
+
+def word_tests(term, exact_match=False):
+    """
+    Return one predicate per word of term, telling whether a lowercase word
+    token matches that word, with the rules the index applies: exact_match
+    compares whole words; otherwise a lone word may occur anywhere inside a
+    token, and a phrase's first word may end a token and its last word start
+    one. A pattern likewise has to match the whole token with exact_match
+    and only part of it otherwise.
+    """
+    if term.pattern is not None:
+        match = term.pattern.fullmatch if exact_match else term.pattern.search
+        return [lambda token: bool(match(token))]
+    words = term.words
+    tests = [lambda token, word=word: token == word for word in words]
+    if not exact_match:
+        if len(words) == 1:
+            tests[0] = lambda token, word=words[0]: word in token
+        else:
+            tests[0] = lambda token, word=words[0]: token.endswith(word)
+            tests[-1] = lambda token, word=words[-1]: token.startswith(word)
+    return tests
+
+
+class _NearScan:
+    def __init__(self, near, exact_match):
+        self.distance = near.distance
+        self.operands = [word_tests(near.left, exact_match), word_tests(near.right, exact_match)]
+        self.span = max(len(tests) for tests in self.operands)
+        self.ends = (deque(), deque())  # Recent end positions of each operand
+        self.found = False
+
+    def add(self, position, window):
+        for side, tests in enumerate(self.operands):
+            if len(window) < len(tests):
+                continue
+            if not all(test(token) for test, token in zip(tests, window[-len(tests):])):
+                continue
+            start = position - len(tests) + 1
+            if any(1 <= start - end <= self.distance for end in self.ends[1 - side]):
+                self.found = True
+                return
+            ends = self.ends[side]
+            ends.append(position)
+            # Older occurrences are too far from anything still to come.
+            while ends[0] < position - self.distance - self.span:
+                ends.popleft()
+
+
+class _PatternScan:
+    span = 1
+
+    def __init__(self, term, exact_match):
+        self.test = word_tests(term, exact_match)[0]
+        self.found = False
+
+    def add(self, position, window):
+        self.found = self.test(window[-1])
+
+
+class WordScan:
+    """
+    Decides the parts of a query that need a document's words, read in
+    order and possibly in chunks: NEAR operators, remembering only each
+    term's recent positions, and wildcard or regex terms, tried on every
+    word until one matches. The words are the same tokens the index keeps,
+    so both agree. A word running to the end of a chunk waits for the next
+    one, in case it continues there.
+    """
+
+    def __init__(self, nodes, exact_match=False):
+        self._scans = {
+            node.key: _NearScan(node, exact_match) if isinstance(node, Near) else _PatternScan(node, exact_match)
+            for node in nodes
+        }
+        self._span = max(scan.span for scan in self._scans.values())
+        self._window = []
+        self._position = -1
+        self._carry = ""
+
+    def found(self, near):
+        return self._scans[near.key].found
+
+    def feed(self, text, final=False):
+        """Read the words of text, which must already be lowercase."""
+        pending = [scan for scan in self._scans.values() if not scan.found]
+        if not pending:
+            return
+        text = self._carry + text
+        self._carry = ""
+        window = self._window
+        for match in WORD_RE.finditer(text):
+            if not final and match.end() == len(text):
+                self._carry = match.group()
+                break
+            self._position += 1
+            window.append(match.group())
+            if len(window) > self._span:
+                del window[0]
+            for scan in pending:
+                if not scan.found:
+                    scan.add(self._position, window)
+
+
+def match_chunks(compiled, chunks):
+    """
+    Match compiled against an iterable of text chunks, stopping as soon as
+    the result is known. Returns (matched, read_all); the rest of the
+    iterable is not consumed when read_all is False.
+    """
+    stream = compiled.stream()
+    for chunk in chunks:
+        decided = stream.feed(chunk)
+        if decided is not None:
+            return decided, False
+    return stream.finish(), True
+
+
+@lru_cache(maxsize=64)
+def compile_query(query, exact_match=False):
+    """Return the CompiledQuery for query; raises QuerySyntaxError if malformed."""
+    return CompiledQuery(query, exact_match)
+
+
+def boolean_search(text, query, exact_match=False):
+    try:
+        if profiling.enabled:
+            started = time.perf_counter()
+            matched = compile_query(query, exact_match).matches(text)
+            profiling.add_stage("boolean_search", time.perf_counter() - started)
+            return matched
+        return compile_query(query, exact_match).matches(text)
+    except QuerySyntaxError as e:
+        print(f"Error evaluating boolean query '{query}': {e}")
+        return False
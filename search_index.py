@@ -0,0 +1,491 @@
+import os
+import re
+import math
+import heapq
+import bisect
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from extractors import EXTRACTOR_VERSION
+from fuzzy import LevenshteinAutomaton
+from query import compile_query, Near
+from walker import walk_files
+
+TOKEN_RE = re.compile(r'\w+')
+BM25_K1 = 1.2  # Term-frequency saturation
+BM25_B = 0.75  # Document-length normalization
+MAX_QUERY_GRAMS = 64  # Trigrams intersected per lookup; the candidates are verified anyway
+INDEX_DIR = os.environ.get(
+    "SEARCHSTRING_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".searchstring", "indexes"),
+)
+
+
+def index_path_for(folder):
+    """Return the on-disk location of the index for folder."""
+    key = hashlib.sha1(os.path.abspath(folder).encode("utf-8", errors="surrogatepass")).hexdigest()
+    return os.path.join(INDEX_DIR, key[:16] + ".sqlite")
+
+
+def tokenize(text):
+    """Return {term: [token positions]} for the lowercased words of text."""
+    terms = {}
+    for position, match in enumerate(TOKEN_RE.finditer(text.lower())):
+        terms.setdefault(match.group(0), []).append(position)
+    return terms
+
+
+def tokenize_chunks(chunks):
+    """
+    Return tokenize("".join(chunks)) without ever joining the chunks: a word
+    running to the end of one chunk is carried over into the next.
+    """
+    terms = {}
+    position = 0
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        cut = len(text)
+        while cut and (text[cut - 1].isalnum() or text[cut - 1] == "_"):
+            cut -= 1
+        carry = text[cut:]
+        for match in TOKEN_RE.finditer(text[:cut].lower()):
+            terms.setdefault(match.group(0), []).append(position)
+            position += 1
+    for match in TOKEN_RE.finditer(carry.lower()):
+        terms.setdefault(match.group(0), []).append(position)
+        position += 1
+    return terms
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def near_count(left_starts, left_length, right_starts, right_length, distance):
+    """
+    Return how many occurrences of a term (sorted start positions, each
+    spanning left_length tokens) have an occurrence of another (likewise)
+    at most distance positions before or after them, without overlapping.
+    """
+    count = 0
+    for start in left_starts:
+        end = start + left_length - 1
+        # After: the other starts within distance of our end
+        i = bisect.bisect_left(right_starts, end + 1)
+        if i < len(right_starts) and right_starts[i] <= end + distance:
+            count += 1
+            continue
+        # Before: the other ends within distance of our start
+        i = bisect.bisect_left(right_starts, start - distance - right_length + 1)
+        if i < len(right_starts) and right_starts[i] <= start - right_length:
+            count += 1
+    return count
+
+
+class SearchIndex:
+    """
+    Persistent inverted index over the files of one folder.
+
+    Every file's extracted text is tokenized once into term -> posting list
+    (doc id plus token positions). Queries are then answered with set
+    operations on posting lists instead of rescanning document text.
+
+    Partial words, wildcards and regexes are looked up in the vocabulary
+    through a trigram index (trigram -> words containing it): only words
+    holding every trigram of the term's literal parts are tested.
+    """
+
+    def __init__(self, folder, path=None):
+        self.folder = os.path.abspath(folder)
+        self.path = path or index_path_for(folder)
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT UNIQUE NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " length INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " id INTEGER PRIMARY KEY,"
+            " term TEXT UNIQUE NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term_id INTEGER NOT NULL,"
+            " doc_id INTEGER NOT NULL,"
+            " positions BLOB NOT NULL,"
+            " PRIMARY KEY (term_id, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);"
+            "CREATE TABLE IF NOT EXISTS term_grams ("
+            " gram TEXT NOT NULL,"
+            " term_id INTEGER NOT NULL,"
+            " PRIMARY KEY (gram, term_id)) WITHOUT ROWID;"
+        )
+        if self._conn.execute("SELECT 1 FROM term_grams LIMIT 1").fetchone() is None:
+            # Indexes built before term_grams existed
+            self._add_grams(self._conn.execute("SELECT id, term FROM terms").fetchall())
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != EXTRACTOR_VERSION:
+            # Built from another version of the extractors: sync() re-indexes every file
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute(f"PRAGMA user_version = {EXTRACTOR_VERSION}")
+        self._conn.commit()
+
+    @staticmethod
+    def exists(folder):
+        return os.path.exists(index_path_for(folder))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Building ---
+
+    def list_files(self):
+        return list(walk_files(self.folder))
+
+    def documents(self):
+        """Return {path: (size, mtime_ns)} for every indexed file."""
+        with self._lock:
+            return {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in self._conn.execute("SELECT path, size, mtime_ns FROM docs")
+            }
+
+    def sync(self, filepaths=None):
+        """
+        Return {path: os.stat_result} for the files among filepaths (default:
+        the files under the folder) that are new or have changed since they
+        were indexed, and drop entries for files that no longer exist.
+
+        filepaths is often filtered (include/exclude globs, depth, copies
+        left out), and the index is shared by every search of the folder,
+        so an indexed file missing from filepaths is only dropped once it is
+        gone from disk.
+        """
+        if filepaths is None:
+            filepaths = self.list_files()
+        known = self.documents()
+        seen = set()
+        stale = {}
+        for filepath in filepaths:
+            filepath = os.path.abspath(filepath)
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            seen.add(filepath)
+            if known.get(filepath) != (st.st_size, st.st_mtime_ns):
+                stale[filepath] = st
+        for path in set(known) - seen:
+            if not os.path.isfile(path):
+                self.remove_document(path)
+        return stale
+
+    def update(self, extract_files, filepaths=None):
+        """
+        Bring the index in line with the folder: index new and modified files
+        and drop entries for files that no longer exist. extract_files takes a
+        list of paths and yields (path, text) pairs in any order, text being
+        None for a file that could not be extracted (timed out or crashed its
+        worker); such files are left stale, to be retried next time.
+        Returns the number of files (re)indexed.
+        """
+        stale = self.sync(filepaths)
+        indexed = 0
+        for filepath, text in extract_files(list(stale)):
+            if text is None:
+                continue
+            self.add_document(filepath, text, stale[filepath])
+            indexed += 1
+        return indexed
+
+    def add_document(self, filepath, text, st):
+        """
+        Index text as the content of filepath at version st. text may also be
+        the {term: positions} that tokenize_chunks() returns for a document
+        too large to pass around whole.
+        """
+        filepath = os.path.abspath(filepath)
+        terms = text if isinstance(text, dict) else tokenize(text)
+        with self._lock:
+            conn = self._conn
+            self._delete_doc(filepath)
+            cursor = conn.execute(
+                "INSERT INTO docs (path, size, mtime_ns, length) VALUES (?, ?, ?, ?)",
+                (filepath, st.st_size, st.st_mtime_ns, sum(len(p) for p in terms.values())),
+            )
+            doc_id = cursor.lastrowid
+            term_ids = self._term_ids(list(terms))
+            new = [t for t in terms if t not in term_ids]
+            conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", ((t,) for t in new))
+            new_ids = self._term_ids(new)
+            self._add_grams((term_id, t) for t, term_id in new_ids.items())
+            term_ids.update(new_ids)
+            conn.executemany(
+                "INSERT INTO postings (term_id, doc_id, positions) VALUES (?, ?, ?)",
+                ((term_ids[t], doc_id, array("I", p).tobytes()) for t, p in terms.items()),
+            )
+            conn.commit()
+        return doc_id
+
+    def remove_document(self, filepath):
+        with self._lock:
+            self._delete_doc(os.path.abspath(filepath))
+            self._conn.commit()
+
+    def _delete_doc(self, filepath):
+        row = self._conn.execute("SELECT id FROM docs WHERE path = ?", (filepath,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+
+    def _term_ids(self, terms):
+        ids = {}
+        # Stay below SQLite's bound-parameter limit.
+        for start in range(0, len(terms), 500):
+            chunk = terms[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            ids.update(self._conn.execute(
+                f"SELECT term, id FROM terms WHERE term IN ({marks})", chunk
+            ))
+        return ids
+
+    def _add_grams(self, rows):
+        """Index the trigrams of (term id, term) rows."""
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO term_grams (gram, term_id) VALUES (?, ?)",
+            ((gram, term_id) for term_id, term in rows for gram in trigrams(term)),
+        )
+
+    # --- Querying ---
+
+    def all_docs(self):
+        return {row[0] for row in self._conn.execute("SELECT id FROM docs")}
+
+    def _word_ids(self, word, mode):
+        """
+        Return the ids of indexed words that equal word ("exact"), contain it
+        ("substring"), start with it ("prefix") or end with it ("suffix").
+        """
+        if mode == "exact":
+            return [row[0] for row in self._conn.execute("SELECT id FROM terms WHERE term = ?", (word,))]
+        if len(word) < 3:
+            # No trigram to narrow down with; SQLite scans the vocabulary.
+            escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            pattern = {"substring": "%{}%", "prefix": "{}%", "suffix": "%{}"}[mode].format(escaped)
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM terms WHERE term LIKE ? ESCAPE '\\'", (pattern,)
+            )]
+        test = {
+            "substring": lambda term: word in term,
+            "prefix": lambda term: term.startswith(word),
+            "suffix": lambda term: term.endswith(word),
+        }[mode]
+        return self._matching_ids(test, [word])
+
+    def _pattern_ids(self, term, exact_match=False):
+        """Return the ids of indexed words matched by a wildcard or /regex/ term (see query.word_tests)."""
+        if isinstance(term.pattern, LevenshteinAutomaton):
+            return self._fuzzy_ids(term.pattern)
+        match = term.pattern.fullmatch if exact_match else term.pattern.search
+        return self._matching_ids(lambda word: bool(match(word)), term.literals)
+
+    def _fuzzy_ids(self, automaton):
+        """
+        Return the ids of indexed words within automaton.max_edits typos of
+        automaton.word. An edit breaks at most three of the word's trigrams,
+        so only words of a close enough length sharing the rest are run
+        through the automaton; for words too short for that, every word of
+        a close enough length is.
+        """
+        word, edits = automaton.word, automaton.max_edits
+        grams = sorted(trigrams(word))[:MAX_QUERY_GRAMS]
+        needed = len(grams) - 3 * edits
+        lengths = (len(word) - edits, len(word) + edits)
+        if needed > 0:
+            marks = ",".join("?" * len(grams))
+            rows = self._conn.execute(
+                "SELECT t.id, t.term FROM term_grams g JOIN terms t ON t.id = g.term_id"
+                f" WHERE g.gram IN ({marks}) AND length(t.term) BETWEEN ? AND ?"
+                " GROUP BY g.term_id HAVING COUNT(*) >= ?",
+                (*grams, *lengths, needed),
+            )
+        else:
+            rows = self._conn.execute("SELECT id, term FROM terms WHERE length(term) BETWEEN ? AND ?", lengths)
+        return [term_id for term_id, term in rows if automaton.fullmatch(term)]
+
+    def _matching_ids(self, test, literals):
+        """
+        Return the ids of indexed words passing test. Only words containing
+        every trigram of literals (substrings any match contains) are tried;
+        without a trigram among them, the whole vocabulary is.
+        """
+        grams = sorted(set().union(*(trigrams(literal) for literal in literals)))[:MAX_QUERY_GRAMS]
+        if grams:
+            marks = ",".join("?" * len(grams))
+            rows = self._conn.execute(
+                "SELECT t.id, t.term FROM term_grams g JOIN terms t ON t.id = g.term_id"
+                f" WHERE g.gram IN ({marks}) GROUP BY g.term_id HAVING COUNT(*) = ?",
+                (*grams, len(grams)),
+            )
+        else:
+            rows = self._conn.execute("SELECT id, term FROM terms")
+        return [term_id for term_id, word in rows if test(word)]
+
+    def _term_ids_for(self, term, exact_match=False):
+        """Return the ids of the indexed words a single-word term matches."""
+        if term.pattern is not None:
+            return self._pattern_ids(term, exact_match)
+        return self._word_ids(term.words[0], "exact" if exact_match else "substring")
+
+    def _postings(self, term_ids, positions=True):
+        """
+        Return {doc id: set of token positions} for the words with term_ids.
+        Without positions, return {doc id: number of occurrences} instead,
+        read from the stored blob sizes without decoding them.
+        """
+        columns = "doc_id, positions" if positions else "doc_id, length(positions)"
+        rows = self._rows(f"SELECT {columns} FROM postings WHERE term_id IN ({{}})", term_ids)
+        if not positions:
+            counts = {}
+            for doc_id, nbytes in rows:
+                counts[doc_id] = counts.get(doc_id, 0) + nbytes // array("I").itemsize
+            return counts
+        postings = {}
+        for doc_id, blob in rows:
+            decoded = array("I")
+            decoded.frombytes(blob)
+            postings.setdefault(doc_id, set()).update(decoded)
+        return postings
+
+    def docs_for_term(self, term, exact_match=False):
+        """
+        Return the ids of documents containing term: as whole words when
+        exact_match is set, otherwise anywhere inside a word (substring).
+        Phrases must appear as consecutive words. term may also be a Near,
+        whose terms must appear close enough to each other.
+        """
+        return set(self.term_frequencies(term, exact_match))
+
+    def term_frequencies(self, term, exact_match=False):
+        """Return {doc id: occurrences of term} for the documents containing it (see docs_for_term)."""
+        if isinstance(term, Near):
+            return self.near_frequencies(term, exact_match)
+        if len(term.words) == 1:
+            return self._postings(self._term_ids_for(term, exact_match), positions=False)
+        return {doc_id: len(starts) for doc_id, starts in self.term_positions(term, exact_match).items()}
+
+    def near_frequencies(self, near, exact_match=False):
+        """
+        Return {doc id: occurrences of near.left with near.right close by},
+        from the stored positions of both terms; no text is read.
+        """
+        left = self.term_positions(near.left, exact_match)
+        right = self.term_positions(near.right, exact_match)
+        frequencies = {}
+        for doc_id in left.keys() & right.keys():
+            count = near_count(left[doc_id], len(near.left.words), right[doc_id], len(near.right.words),
+                               near.distance)
+            if count:
+                frequencies[doc_id] = count
+        return frequencies
+
+    def term_positions(self, term, exact_match=False):
+        """Return {doc id: sorted start positions of term} for the documents containing it."""
+        words = term.words
+        if len(words) == 1:
+            postings = self._postings(self._term_ids_for(term, exact_match))
+            return {doc_id: sorted(positions) for doc_id, positions in postings.items()}
+        modes = ["exact"] * len(words)
+        if not exact_match:
+            # "machine lea" matches "...machine learning": the first word may
+            # end a longer word and the last may start one.
+            modes[0], modes[-1] = "suffix", "prefix"
+        postings = [self._postings(self._word_ids(word, mode)) for word, mode in zip(words, modes)]
+        candidates = set.intersection(*(set(p) for p in postings))
+        starts = {}
+        for doc_id in candidates:
+            found = sorted(
+                start for start in postings[0][doc_id]
+                if all(start + i in postings[i][doc_id] for i in range(1, len(words)))
+            )
+            if found:
+                starts[doc_id] = found
+        return starts
+
+    def search(self, query, exact_match=False):
+        """
+        Return the paths of documents matching the boolean query, sorted.
+        Raises QuerySyntaxError for a malformed query.
+        """
+        compiled = compile_query(query, exact_match)
+        with self._lock:
+            doc_ids = compiled.root.evaluate_sets(
+                lambda term: self.docs_for_term(term, exact_match), self.all_docs
+            )
+            return sorted(self._paths(doc_ids))
+
+    def rank(self, query, exact_match=False, k=50, within=None):
+        """
+        Return up to k (path, score) pairs for the documents matching the
+        boolean query, best first, among the paths in within if given (the
+        index may also hold files a filtered search left out). Scored with
+        BM25 over the query's positive terms and NEAR pairs, a pair's
+        frequency being how often its terms occur within distance of each
+        other. Term frequencies come from the posting lists and document
+        lengths from docs.length, both stored at index time; the top k are
+        kept with a heap, so cost grows as O(matches log k).
+        Raises QuerySyntaxError for a malformed query.
+        """
+        compiled = compile_query(query, exact_match)
+        with self._lock:
+            frequencies = {}
+
+            def lookup(term):
+                if term.key not in frequencies:
+                    frequencies[term.key] = self.term_frequencies(term, exact_match)
+                return set(frequencies[term.key])
+
+            doc_ids = compiled.root.evaluate_sets(lookup, self.all_docs)
+            if within is not None and doc_ids:
+                within = [os.path.abspath(path) for path in within]
+                doc_ids &= {row[0] for row in self._rows("SELECT id FROM docs WHERE path IN ({})", within)}
+            if not doc_ids:
+                return []
+            n_docs, avg_length = self._conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            avg_length = avg_length or 1
+            lengths = self._lengths(doc_ids)
+            scores = dict.fromkeys(doc_ids, 0.0)
+            for term in compiled.scored_terms:
+                if term.key not in frequencies:
+                    frequencies[term.key] = self.term_frequencies(term, exact_match)
+                tfs = frequencies[term.key]
+                idf = math.log(1 + (n_docs - len(tfs) + 0.5) / (len(tfs) + 0.5))
+                for doc_id in doc_ids.intersection(tfs):
+                    tf = tfs[doc_id]
+                    norm = 1 - BM25_B + BM25_B * lengths.get(doc_id, 0) / avg_length
+                    scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            paths = dict(self._rows("SELECT id, path FROM docs WHERE id IN ({})", [doc_id for doc_id, _ in top]))
+            return [(paths[doc_id], score) for doc_id, score in top]
+
+    def _lengths(self, doc_ids):
+        return dict(self._rows("SELECT id, length FROM docs WHERE id IN ({})", list(doc_ids)))
+
+    def _rows(self, sql, ids):
+        # Stay below SQLite's bound-parameter limit.
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            yield from self._conn.execute(sql.format(",".join("?" * len(chunk))), chunk)
+
+    def _paths(self, doc_ids):
+        return [row[0] for row in self._rows("SELECT path FROM docs WHERE id IN ({})", list(doc_ids))]
+
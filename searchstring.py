@@ -0,0 +1,312 @@
+"""
+Headless command-line search, for batch jobs and servers without a display.
+
+    python -m searchstring Resume_Download 'python AND (django OR flask)'
+    python -m searchstring /data/cvs '"machine learning"' --exact --format csv
+    python -m searchstring Resume_Download 'kubernetes' --snippets --dedupe
+    python -m searchstring /data/cvs 'python NEAR/5 django'
+    python -m searchstring /data/cvs 'kube* AND /post(gres|gresql)?/' --index
+    python -m searchstring /data/cvs 'kubernets~1 OR javscript~2' --index
+
+Prints the matching files (relative to the folder) and exits with status 0
+when something matched, 1 when nothing did and 2 on a usage or query error.
+Throughput is reported on stderr so it never mixes with the results.
+
+    python -m searchstring --import-times
+
+reports how long each of the app's modules and each parsing backend takes
+to import in a fresh interpreter, i.e. what startup pays for.
+
+    python -m searchstring /data/cvs 'python' --profile profile.json
+
+also reports where the search spent its time (slowest files, time per
+format, index stages) on stderr, and saves the numbers as JSON.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import subprocess
+
+import profiling
+from text_cache import TextCache, DEFAULT_CACHE_PATH
+from search_index import SearchIndex
+from folder_search import search_folder
+from query import compile_query, QuerySyntaxError
+from walker import walk_files
+from extractors import import_times
+from dedup import find_duplicates, group_duplicates
+
+APP_MODULES = ["query", "multimatch", "walker", "extractors", "text_cache", "search_index",
+               "extract_pool", "folder_search"]
+BACKENDS = ["fitz", "etree", "openpyxl", "pandas"]
+
+EXIT_MATCH = 0
+EXIT_NO_MATCH = 1
+EXIT_ERROR = 2
+
+
+def _cold_import_seconds(statement):
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); t = time.perf_counter(); "
+        f"{statement}; print(time.perf_counter() - t)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code, os.path.dirname(os.path.abspath(__file__))],
+        capture_output=True, text=True,
+    )
+    try:
+        return float(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def import_report(out=sys.stderr):
+    """Print the cold import time of every app module and parsing backend."""
+    rows = [(name, _cold_import_seconds(f"import {name}")) for name in APP_MODULES]
+    # Backends are timed on top of extractors, as the app loads them.
+    rows += [
+        (f"backend {name}", _cold_import_seconds(f"import extractors; extractors.backend({name!r})"))
+        for name in BACKENDS
+    ]
+    for name, seconds in rows:
+        print(f"{name:<20} {'unavailable' if seconds is None else f'{seconds * 1000:8.1f} ms'}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="searchstring",
+        description="Search the documents in a folder with a boolean query.",
+    )
+    parser.add_argument("--import-times", action="store_true",
+                        help="report module import times and exit")
+    parser.add_argument("folder", nargs="?", help="folder to search")
+    parser.add_argument("query", nargs="?", help='boolean query, e.g. \'python AND (django OR "machine learning")\'')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--exact", dest="exact_match", action="store_true",
+                      help="match whole words only")
+    mode.add_argument("--partial", dest="exact_match", action="store_false",
+                      help="match terms anywhere inside words (default)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes for extraction (default: one per CPU)")
+    parser.add_argument("-f", "--format", choices=("text", "json", "csv"), default="text",
+                        help="output format (default: text, one path per line)")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="only search the top level of folder")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="only search files matching GLOB (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="skip files and folders matching GLOB (repeatable)")
+    parser.add_argument("--max-depth", type=int, default=None,
+                        help="how many folder levels below folder to descend")
+    parser.add_argument("--index", action="store_true",
+                        help="answer from (and update) the folder's inverted index")
+    parser.add_argument("--top", type=int, default=None, metavar="K",
+                        help="list only the K best matches, ranked by BM25 (uses the index)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="do not read or write the extracted-text cache")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH,
+                        help="location of the extracted-text cache")
+    parser.add_argument("--timings", action="store_true",
+                        help="also report parsing-backend import times of this process on stderr")
+    parser.add_argument("-a", "--all", dest="show_all", action="store_true",
+                        help="list every file searched with its result, not just matches")
+    parser.add_argument("-s", "--snippets", action="store_true",
+                        help="show where each term matched, with page numbers and context")
+    parser.add_argument("-d", "--dedupe", action="store_true",
+                        help="search identical files once and list copies under their original")
+    parser.add_argument("--profile", nargs="?", const="", metavar="JSON",
+                        help="report per-file and per-stage timings on stderr, and save them to JSON if given")
+    args = parser.parse_args(argv)
+    if not args.import_times and args.query is None:
+        parser.error("the following arguments are required: folder, query")
+    return args
+
+
+HIT_FIELDS = ["term", "start", "end", "page", "snippet"]
+
+
+def _write_details(path, out, hits, copies):
+    """Text output: a file's identical copies and hits, indented under it."""
+    if copies is not None:
+        for copy in copies.get(path, []):
+            out.write(f"    = {copy}\n")
+    if hits is not None:
+        for hit in hits.get(path, []):
+            where = f"p.{hit.page}" if hit.page is not None else f"@{hit.start}"
+            out.write(f"    {where:>8}  {hit.snippet}\n")
+
+
+def _details(path, hits, copies):
+    """JSON output: a file's identical copies and hits."""
+    record = {}
+    if copies is not None:
+        record["duplicates"] = copies.get(path, [])
+    if hits is not None:
+        record["hits"] = [hit._asdict() for hit in hits.get(path, [])]
+    return record
+
+
+def _csv_header(header, hits, copies):
+    return header + (["duplicates"] if copies is not None else []) + (HIT_FIELDS if hits is not None else [])
+
+
+def _csv_rows(row, path, hits, copies):
+    """CSV rows for one file: row followed by each hit's fields, or blanks without hits."""
+    if copies is not None:
+        row = row + [";".join(copies.get(path, []))]
+    if hits is None:
+        return [row]
+    if not hits.get(path):
+        return [row + [""] * len(HIT_FIELDS)]
+    return [row + ["" if value is None else value for value in hit] for hit in hits[path]]
+
+
+def write_results(results, fmt, show_all, out, hits=None, copies=None):
+    """
+    results is a list of (relative path, matched) pairs, sorted; hits, if
+    given, maps relative paths to their Hits and copies maps them to the
+    relative paths of their identical copies (which results then leaves out).
+    """
+    if not show_all:
+        results = [(path, matched) for path, matched in results if matched]
+    if fmt == "json":
+        if hits is None and copies is None:
+            records = (
+                [{"path": path, "matched": matched} for path, matched in results] if show_all
+                else [path for path, matched in results]
+            )
+        else:
+            records = [
+                dict({"path": path, "matched": matched} if show_all else {"path": path},
+                     **_details(path, hits, copies))
+                for path, matched in results
+            ]
+        json.dump(records, out, indent=2)
+        out.write("\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(_csv_header(["path", "matched"] if show_all else ["path"], hits, copies))
+        for path, matched in results:
+            row = [path, "" if matched is None else int(matched)] if show_all else [path]
+            writer.writerows(_csv_rows(row, path, hits, copies))
+    else:
+        for path, matched in results:
+            out.write(f"{path}\t{'error' if matched is None else int(matched)}\n" if show_all else f"{path}\n")
+            _write_details(path, out, hits, copies)
+
+
+def write_ranked(ranked, fmt, out, hits=None, copies=None):
+    """ranked is a list of (relative path, score) pairs, best first; hits and copies as for write_results."""
+    if fmt == "json":
+        json.dump(
+            [dict({"path": path, "score": round(score, 4)}, **_details(path, hits, copies)) for path, score in ranked],
+            out, indent=2,
+        )
+        out.write("\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(_csv_header(["path", "score"], hits, copies))
+        for path, score in ranked:
+            writer.writerows(_csv_rows([path, f"{score:.4f}"], path, hits, copies))
+    else:
+        for path, score in ranked:
+            out.write(f"{score:8.3f}  {path}\n")
+            _write_details(path, out, hits, copies)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.import_times:
+        import_report()
+        return EXIT_MATCH
+    if not os.path.isdir(args.folder):
+        print(f"Folder not found: {args.folder}", file=sys.stderr)
+        return EXIT_ERROR
+    try:
+        compile_query(args.query, args.exact_match)
+    except QuerySyntaxError as e:
+        print(f"Invalid search query: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.profile is not None:
+        profiling.enable()
+    filepaths = walk_files(args.folder, args.recursive, args.include, args.exclude, max_depth=args.max_depth)
+    if args.top:
+        filepaths = list(filepaths)  # Ranking is limited to the files searched
+    cache = TextCache(args.cache_path) if args.cache else None
+    index = SearchIndex(args.folder) if args.index or args.top else None
+    started = time.monotonic()
+    results = []
+    hits = {} if args.snippets else None
+    duplicates = copies = None
+    ranked = None
+    nbytes = 0
+    try:
+        if args.dedupe:
+            filepaths = list(filepaths)
+            duplicates = find_duplicates(filepaths, cache)
+            copies = {
+                os.path.relpath(original, args.folder): [os.path.relpath(copy, args.folder) for copy in group]
+                for original, group in group_duplicates(duplicates).items()
+            }
+        for path, matched, *found in search_folder(filepaths, args.query, args.exact_match, cache, index,
+                                                   args.jobs, args.snippets, duplicates):
+            relpath = os.path.relpath(path, args.folder)
+            results.append((relpath, matched))
+            if found and found[0]:
+                hits[relpath] = found[0]
+            try:
+                nbytes += os.path.getsize(path)
+            except OSError:
+                pass
+        if args.top:
+            ranked = [
+                (os.path.relpath(path, args.folder), score)
+                for path, score in index.rank(args.query, args.exact_match, args.top, filepaths)
+            ]
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if index is not None:
+            index.close()
+        if cache is not None:
+            cache.close()
+    elapsed = max(time.monotonic() - started, 1e-6)
+
+    results.sort()
+    listed = results
+    if copies is not None:
+        # Copies are listed under their original instead of on their own
+        hidden = {copy for group in copies.values() for copy in group}
+        listed = [(path, matched) for path, matched in results if path not in hidden]
+    if ranked is not None:
+        write_ranked(ranked, args.format, sys.stdout, hits, copies)
+    else:
+        write_results(listed, args.format, args.show_all, sys.stdout, hits, copies)
+    matches = sum(1 for path, matched in results if matched)
+    failed = sum(1 for path, matched in results if matched is None)
+    print(
+        f"{matches} of {len(results)} files matched in {elapsed:.2f}s"
+        f" ({len(results) / elapsed:.1f} files/s, {nbytes / elapsed / 1e6:.1f} MB/s)"
+        + (f", {failed} could not be read" if failed else "")
+        + (f", {len(duplicates)} duplicate(s) not read" if duplicates else ""),
+        file=sys.stderr,
+    )
+    if args.timings:
+        # Worker processes import their own backends; these are the ones
+        # loaded here (all of them with --jobs 1).
+        for name, seconds in sorted(import_times().items()):
+            print(f"imported {name} in {seconds * 1000:.1f} ms", file=sys.stderr)
+    if args.profile is not None:
+        report = profiling.report()
+        print(profiling.format_report(report), file=sys.stderr)
+        if args.profile:
+            profiling.write_json(args.profile, report)
+    return EXIT_MATCH if matches else EXIT_NO_MATCH
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import re
+import bisect
+from collections import namedtuple
+
+from query import WORD_RE, word_tests
+
+SNIPPET_CONTEXT = 40  # Characters of context on each side of a hit
+HITS_PER_TERM = 3  # Hits kept per query term and document
+
+# term is the query term (a word or a space-separated phrase); start/end
+# index the extracted text, as cached (for plain-text files scanned byte
+# for byte, the file's bytes); page is 1-based for PDFs and None for formats
+# without pages.
+Hit = namedtuple("Hit", "term start end page snippet")
+
+
+class _WordPattern:
+    """Stands in for a regex whose finditer() yields the words a wildcard or /regex/ term matches."""
+
+    def __init__(self, test):
+        self.test = test
+
+    def finditer(self, text):
+        return (match for match in WORD_RE.finditer(text) if self.test(match.group().lower()))
+
+
+def term_regex(term, exact_match=False):
+    """
+    Return a case-insensitive regex finding term in original text, with the
+    same rules as MultiMatcher: phrase words may be separated by any run of
+    non-word characters and exact_match requires whole words. Pattern terms
+    get a _WordPattern, whose hits are whole words.
+    """
+    if term.pattern is not None:
+        return _WordPattern(word_tests(term, exact_match)[0])
+    pattern = r"\W+".join(re.escape(word) for word in term.words)
+    if exact_match:
+        pattern = rf"(?<!\w){pattern}(?!\w)"
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def make_snippet(text, start, end, context=SNIPPET_CONTEXT, offset=0, decode=None):
+    """
+    Return text[start:end] with up to context characters around it, on one
+    line. offset is where text begins in the document, if not at its start;
+    decode, if given, is applied to the excerpt before whitespace is
+    collapsed.
+    """
+    lo = max(start - context, 0)
+    hi = min(end + context, len(text))
+    excerpt = text[lo:hi] if decode is None else decode(text[lo:hi])
+    snippet = " ".join(excerpt.split())
+    return ("..." if lo > 0 or offset > 0 else "") + snippet + ("..." if hi < len(text) else "")
+
+
+class HitCollector:
+    """
+    Finds the first few hits of every positive query term in a document fed
+    in chunks, next to the QueryStream matching it, so offsets and snippets
+    come out of the same pass that decides the match.
+
+    Like QueryStream, it carries a tail of each chunk into the next, long
+    enough for a hit and its context on both sides; a hit is only taken once
+    the text after it has arrived. Once every term has its hits, feed() just
+    keeps count of offsets (and, with paged, of where each chunk starts).
+    """
+
+    def __init__(self, compiled, paged=False, per_term=HITS_PER_TERM, context=SNIPPET_CONTEXT,
+                 decode=None):
+        self.terms = [(term.key, term_regex(term, compiled.exact_match)) for term in compiled.positive_terms]
+        self.found = {key: [] for key, _ in self.terms}
+        self.page_starts = [] if paged else None
+        self.paged = paged
+        self.per_term = per_term
+        self.context = context
+        self.decode = decode  # Applied to snippets, e.g. to undo a latin-1 scan
+        self._buffer = ""
+        self._offset = 0  # Document offset of _buffer[0]
+        self._taken = 0  # Hits ending at or before this document offset are done
+        self._keep = 2 * context + 1 + max((len(key) for key in self.found), default=0) + 64
+
+    @property
+    def full(self):
+        return all(len(hits) >= self.per_term for hits in self.found.values())
+
+    def feed(self, chunk):
+        if self.paged:
+            self.page_starts.append(self._offset + len(self._buffer))
+        if self.full:
+            self._offset += len(self._buffer) + len(chunk)
+            self._buffer = ""
+            return
+        self._buffer += chunk
+        self._collect(final=False)
+        if len(self._buffer) > self._keep:
+            drop = len(self._buffer) - self._keep
+            self._buffer = self._buffer[drop:]
+            self._offset += drop
+
+    def finish(self):
+        """Return the hits found, in document order."""
+        if not self.full:
+            self._collect(final=True)
+        return sorted((hit for hits in self.found.values() for hit in hits), key=lambda hit: hit.start)
+
+    def _page(self, offset):
+        return bisect.bisect_right(self.page_starts, offset) if self.page_starts else None
+
+    def _collect(self, final):
+        buffer = self._buffer
+        # Until the end, leave room for a hit's context and one character
+        # more, so a snippet reaching the end of the buffer means the end of
+        # the document.
+        limit = self._offset + len(buffer) - (0 if final else self.context + 1)
+        for key, regex in self.terms:
+            hits = self.found[key]
+            for match in regex.finditer(buffer):
+                if len(hits) >= self.per_term:
+                    break
+                start, end = self._offset + match.start(), self._offset + match.end()
+                if end <= self._taken:
+                    continue
+                if end > limit:
+                    break
+                snippet = make_snippet(buffer, match.start(), match.end(), self.context, self._offset,
+                                       self.decode)
+                hits.append(Hit(key, start, end, self._page(start), snippet))
+        self._taken = max(self._taken, limit)
+
+
+def find_hits(compiled, text, page_starts=None, per_term=HITS_PER_TERM, context=SNIPPET_CONTEXT):
+    """Return the hits of compiled's positive terms in text, e.g. cached text and its page starts."""
+    collector = HitCollector(compiled, per_term=per_term, context=context)
+    collector.page_starts = page_starts
+    collector.feed(text)
+    return collector.finish()
+
+
+def cached_hits(cache, filepath, compiled):
+    """Return the hits in filepath's cached text, or [] when it is not cached."""
+    if cache is None:
+        return []
+    cached = cache.get(filepath, with_pages=True)
+    if cached is None:
+        return []
+    text, page_starts = cached
+    return find_hits(compiled, text, page_starts)
+
+
+def latin1_to_utf8(excerpt):
+    """Re-decode an excerpt of UTF-8 text that was scanned as latin-1."""
+    return excerpt.encode("latin-1").decode("utf-8", errors="ignore")
+
+
+def format_hit(hit):
+    """One-line description of a hit for result lists: page (if any) and snippet."""
+    return f"p.{hit.page}: {hit.snippet}" if hit.page is not None else hit.snippet
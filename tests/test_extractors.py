@@ -0,0 +1,147 @@
+import zipfile
+
+import pytest
+
+from extractors import extract_text, iter_text_from_docx, iter_text_from_pptx
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+MC = 'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+
+
+def make_zip(path, parts):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    return str(path)
+
+
+def paragraph(*runs):
+    return "<w:p>" + "".join(runs) + "</w:p>"
+
+
+def run(text):
+    return f"<w:r><w:t>{text}</w:t></w:r>"
+
+
+def word_part(root, body):
+    return f'<w:{root} {W} {MC}>{body}</w:{root}>'
+
+
+def test_docx_body_then_headers_then_footers_in_number_order(tmp_path):
+    path = make_zip(tmp_path / "cv.docx", {
+        "word/document.xml": word_part("document", "<w:body>" + paragraph(run("Body")) + "</w:body>"),
+        "word/footer1.xml": word_part("ftr", paragraph(run("Footer one"))),
+        "word/header10.xml": word_part("hdr", paragraph(run("Header ten"))),
+        "word/header2.xml": word_part("hdr", paragraph(run("Header two"))),
+        "word/header.xml": word_part("hdr", paragraph(run("Header"))),
+    })
+    assert extract_text(path) == "Body\nHeader\nHeader two\nHeader ten\nFooter one\n"
+
+
+def test_docx_tabs_breaks_tables_and_paragraph_properties(tmp_path):
+    body = (
+        # Tab stops in the paragraph properties are not tabs
+        '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+        "<w:r><w:t>Name</w:t><w:tab/><w:t>Jane</w:t><w:br/><w:t>Doe</w:t></w:r></w:p>"
+        "<w:tbl><w:tr>"
+        "<w:tc>" + paragraph(run("cell one")) + "</w:tc>"
+        "<w:tc>" + paragraph(run("cell two")) + "</w:tc>"
+        "</w:tr></w:tbl>"
+    )
+    path = make_zip(tmp_path / "cv.docx", {
+        "word/document.xml": word_part("document", "<w:body>" + body + "</w:body>"),
+    })
+    assert extract_text(path) == "Name\tJane\nDoe\ncell one\ncell two\n"
+
+
+def test_docx_text_box_is_not_read_twice(tmp_path):
+    box = "<w:txbxContent>" + paragraph(run("boxed")) + "</w:txbxContent>"
+    body = paragraph(
+        "<w:r><mc:AlternateContent>"
+        "<mc:Choice Requires=\"wps\"><w:drawing>" + box + "</w:drawing></mc:Choice>"
+        "<mc:Fallback><w:pict>" + box + "</w:pict></mc:Fallback>"
+        "</mc:AlternateContent></w:r>"
+    )
+    path = make_zip(tmp_path / "cv.docx", {
+        "word/document.xml": word_part("document", "<w:body>" + body + "</w:body>"),
+    })
+    assert extract_text(path).split() == ["boxed"]
+
+
+def test_docx_streams_in_several_chunks(tmp_path):
+    body = "".join(paragraph(run(f"word{i}")) for i in range(2000))
+    path = make_zip(tmp_path / "cv.docx", {
+        "word/document.xml": word_part("document", "<w:body>" + body + "</w:body>"),
+    })
+    chunks = list(iter_text_from_docx(path))
+    assert len(chunks) > 1
+    assert "".join(chunks) == "".join(f"word{i}\n" for i in range(2000))
+
+
+def test_docx_written_by_python_docx(tmp_path):
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = "Jane Doe - CV"
+    document.add_paragraph("Python developer")
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Skills"
+    table.cell(0, 1).text = "SQL"
+    path = str(tmp_path / "cv.docx")
+    document.save(path)
+
+    assert extract_text(path).splitlines() == ["Python developer", "Skills", "SQL", "Jane Doe - CV"]
+
+
+P = ('xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+     'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+
+
+def rels(*targets):
+    body = "".join(f'<Relationship Id="rId{i}" Type="{REL}{kind}" Target="{target}"/>'
+                   for i, (kind, target) in enumerate(targets, 1))
+    return f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{body}</Relationships>'
+
+
+def slide_part(root, *paragraphs):
+    body = "".join(f"<a:p><a:r><a:t>{text}</a:t></a:r></a:p>" for text in paragraphs)
+    return f"<p:{root} {P}><p:cSld><p:spTree><p:sp><p:txBody>{body}</p:txBody></p:sp></p:spTree></p:cSld></p:{root}>"
+
+
+def test_pptx_slides_in_presentation_order_with_notes(tmp_path):
+    path = make_zip(tmp_path / "talk.pptx", {
+        # slide2.xml was moved in front of slide1.xml
+        "ppt/presentation.xml": f'<p:presentation {P}><p:sldIdLst>'
+                                '<p:sldId id="256" r:id="rId2"/><p:sldId id="257" r:id="rId1"/>'
+                                '</p:sldIdLst></p:presentation>',
+        "ppt/_rels/presentation.xml.rels": rels(("slide", "slides/slide1.xml"), ("slide", "slides/slide2.xml")),
+        "ppt/slides/slide1.xml": slide_part("sld", "Filed first"),
+        "ppt/slides/slide2.xml": slide_part("sld", "Shown first"),
+        "ppt/slides/_rels/slide2.xml.rels": rels(("slideLayout", "../slideLayouts/slideLayout1.xml"),
+                                                 ("notesSlide", "../notesSlides/notesSlide1.xml")),
+        "ppt/notesSlides/notesSlide1.xml": slide_part("notes", "Speaker notes"),
+        "ppt/slideLayouts/slideLayout1.xml": slide_part("sldLayout", "Click to add title"),
+    })
+    assert list(iter_text_from_pptx(path)) == ["Shown first\nSpeaker notes\n", "Filed first\n"]
+
+
+def test_pptx_without_presentation_part_uses_slide_numbers(tmp_path):
+    path = make_zip(tmp_path / "talk.pptx", {
+        "ppt/slides/slide10.xml": slide_part("sld", "Ten"),
+        "ppt/slides/slide2.xml": slide_part("sld", "Two"),
+    })
+    assert list(iter_text_from_pptx(path)) == ["Two\n", "Ten\n"]
+
+
+def test_pptx_written_by_python_pptx(tmp_path):
+    pptx = pytest.importorskip("pptx")
+    presentation = pptx.Presentation()
+    for title in ("Python developer", "Machine learning"):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = title
+    presentation.slides[1].notes_slide.notes_text_frame.text = "Mention SQL"
+    path = str(tmp_path / "talk.pptx")
+    presentation.save(path)
+
+    assert list(iter_text_from_pptx(path)) == ["Python developer\n", "Machine learning\nMention SQL\n"]
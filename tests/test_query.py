@@ -0,0 +1,27 @@
+import pytest
+
+from query import QuerySyntaxError, compile_query, required_literals
+
+
+@pytest.mark.parametrize("query", ["python | java", "python & java", "python || java", 'python "machine learning'])
+def test_stray_operator_characters_are_rejected(query):
+    with pytest.raises(QuerySyntaxError):
+        compile_query(query)
+
+
+@pytest.mark.parametrize("query", ['"machine learning" python', "/py|ja/", "tcp/ip and/or", "c++ node.js"])
+def test_other_punctuation_still_parses(query):
+    compile_query(query)
+
+
+@pytest.mark.parametrize("pattern, literals", [
+    (r"\x41bc", ["bc"]),
+    (r"ab\u0041cd", ["ab", "cd"]),
+    (r"\101bc", ["bc"]),
+    (r"\0123", ["3"]),
+    (r"\N{LATIN CAPITAL LETTER A}bc", ["bc"]),
+    (r"(a)\1bc", ["bc"]),
+    (r"py\.thon", ["py", "thon"]),
+])
+def test_escapes_end_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
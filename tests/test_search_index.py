@@ -0,0 +1,157 @@
+import os
+
+import search_index
+import folder_search
+import searchstring
+from search_index import SearchIndex
+
+
+def write(folder, name, text):
+    path = os.path.join(folder, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def test_filtered_search_keeps_other_documents(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    write(folder, "a.txt", "python developer")
+    write(folder, "b.txt", "java developer")
+    write(folder, "c.md", "python and rust")
+    base = [str(folder), "python", "--index", "--no-cache", "-j", "1"]
+
+    searchstring.main(base)
+    index = SearchIndex(str(folder))
+    assert len(index.documents()) == 3
+    index.close()
+
+    searchstring.main(base + ["--include", "*.txt"])
+    searchstring.main(base)
+    index = SearchIndex(str(folder))
+    assert len(index.documents()) == 3
+    index.close()
+
+
+def test_deleted_file_is_dropped(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    write(folder, "a.txt", "python developer")
+    gone = write(folder, "b.txt", "python tester")
+    base = [str(folder), "python", "--index", "--no-cache", "-j", "1"]
+
+    searchstring.main(base)
+    os.remove(gone)
+    searchstring.main(base + ["--include", "*.md"])
+    index = SearchIndex(str(folder))
+    assert list(index.documents()) == [os.path.join(str(folder), "a.txt")]
+    index.close()
+
+
+def test_rank_is_limited_to_searched_files(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    write(folder, "a.txt", "python developer")
+    write(folder, "c.md", "python python python")
+
+    searchstring.main([str(folder), "python", "--index", "--no-cache", "-j", "1"])
+    capsys.readouterr()
+    searchstring.main([str(folder), "python", "--top", "5", "--include", "*.txt", "--no-cache", "-j", "1"])
+    out = capsys.readouterr().out
+    assert "a.txt" in out
+    assert "c.md" not in out
+
+
+def test_tokenize_chunks_matches_tokenize():
+    text = "Naïve café_bar, x2 Python-3 ΣΊΣΥΦΟΣ   end"
+    for size in range(1, 8):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert search_index.tokenize_chunks(chunks) == search_index.tokenize(text)
+
+
+def test_oversized_text_is_indexed_from_its_tokens(tmp_path, monkeypatch):
+    import extract_pool
+
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(extract_pool, "MAX_CACHED_CHARS", 100)
+    folder = tmp_path / "logs"
+    folder.mkdir()
+    path = write(folder, "big.log", "filler words here " * 50 + "needle")
+
+    terms, page_starts, _ = extract_pool.extract_task(path)
+    assert isinstance(terms, dict) and page_starts is None
+    assert terms == search_index.tokenize(open(path, encoding="utf-8").read())
+
+    index = SearchIndex(str(folder))
+    results = list(folder_search.search_folder([path], "needle", index=index, jobs=1))
+    assert results == [(path, True)]
+    index.close()
+
+
+def test_other_extractor_version_is_reindexed(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    path = write(folder, "a.txt", "python developer")
+
+    index = SearchIndex(str(folder))
+    index.update(lambda paths: ((p, "python developer") for p in paths))
+    assert index.documents()
+    index.close()
+
+    monkeypatch.setattr(search_index, "EXTRACTOR_VERSION", search_index.EXTRACTOR_VERSION + 1)
+    index = SearchIndex(str(folder))
+    assert index.documents() == {}
+    assert list(index.sync()) == [path]
+    index.close()
+
+
+def test_rank_scores_near_occurrences(tmp_path):
+    index = SearchIndex(str(tmp_path), path=":memory:")
+    st = os.stat(tmp_path)
+    # Same term frequencies and lengths; only how often the terms are adjacent differs
+    index.add_document(str(tmp_path / "close"), "python sql pad pad python sql pad pad", st)
+    index.add_document(str(tmp_path / "apart"), "python sql pad pad python pad pad sql", st)
+    ranked = index.rank("python NEAR/1 sql")
+    assert [os.path.basename(path) for path, _ in ranked] == ["close", "apart"]
+    assert ranked[0][1] > ranked[1][1]
+    index.close()
+
+
+def test_failed_extraction_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    path = write(folder, "a.txt", "python developer")
+
+    def timed_out(paths, cache=None, jobs=None, with_pages=False):
+        for p in paths:
+            yield (p, None, None) if with_pages else (p, None)
+
+    index = SearchIndex(str(folder))
+    monkeypatch.setattr(folder_search, "extract_files", timed_out)
+    assert list(folder_search.search_folder([path], "python", index=index, jobs=1)) == [(path, None)]
+    assert index.documents() == {}
+    assert index.update(timed_out) == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    assert list(folder_search.search_folder([path], "python", index=index, jobs=1)) == [(path, True)]
+    index.close()
+
+
+def test_rank_with_relative_folder(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    write(folder, "a.txt", "python developer")
+    write(folder, "b.txt", "java developer")
+
+    searchstring.main(["resumes", "python", "--top", "5", "--no-cache", "-j", "1"])
+    out = capsys.readouterr().out
+    assert "a.txt" in out
+    assert "b.txt" not in out
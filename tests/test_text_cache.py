@@ -0,0 +1,45 @@
+import os
+
+import text_cache
+from text_cache import TextCache
+
+
+def test_text_from_other_extractor_version_is_dropped(tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_text("python developer", encoding="utf-8")
+    st = os.stat(path)
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    cache = TextCache(cache_path)
+    cache.put(str(path), "python developer", st)
+    assert cache.get(str(path), st) == "python developer"
+    cache.close()
+
+    cache = TextCache(cache_path)
+    assert cache.get(str(path), st) == "python developer"
+    cache.close()
+
+    monkeypatch.setattr(text_cache, "EXTRACTOR_VERSION", text_cache.EXTRACTOR_VERSION + 1)
+    cache = TextCache(cache_path)
+    assert cache.get(str(path), st) is None
+    cache.close()
+
+
+def test_eviction_keeps_the_most_recently_used(tmp_path):
+    cache = TextCache(str(tmp_path / "cache.sqlite"), max_bytes=2000)
+    paths = []
+    for i in range(40):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(str(i), encoding="utf-8")
+        cache.put(str(path), os.urandom(100).hex(), os.stat(path))
+        paths.append(path)
+    stats = cache.stats()
+    assert cache.evictions > 0
+    assert stats["bytes"] <= 2000
+    assert stats["bytes"] == cache._total
+    assert cache.get(str(paths[-1])) is not None
+    assert cache.get(str(paths[0])) is None
+
+    cache.discard(str(paths[-1]))
+    assert cache.stats()["bytes"] == cache._total
+    cache.close()
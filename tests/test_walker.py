@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import searchstring
+from walker import accepts, walk_files
+
+
+def write(folder, name, data):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_files_with_unknown_extensions_are_sniffed(tmp_path):
+    text = write(tmp_path, "a.txt", b"python")
+    pdf = write(tmp_path, "resume", b"%PDF-1.4\n")
+    write(tmp_path, "notes.bin", b"\x00\x01\x02")
+
+    assert sorted(walk_files(str(tmp_path))) == sorted([text, pdf])
+    assert list(walk_files(str(tmp_path), sniff_content=False)) == [text]
+    assert list(walk_files(str(tmp_path), extensions={"txt"})) == [text]
+    assert list(walk_files(str(tmp_path), exclude=["resume"])) == [text]
+    assert accepts(str(tmp_path), pdf)
+    assert not accepts(str(tmp_path), pdf, sniff_content=False)
+
+
+def test_pdf_without_extension_is_searched(tmp_path, capsys):
+    pymupdf = pytest.importorskip("pymupdf")
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), "python developer")
+    doc.save(str(tmp_path / "resume"))
+    doc.close()
+
+    assert searchstring.main([str(tmp_path), "python", "--no-cache", "-j", "1"]) == searchstring.EXIT_MATCH
+    assert "resume" in capsys.readouterr().out
+
+
+def test_xlsx_without_extension_is_extracted(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    from extractors import extract_text
+
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["python", "developer"])
+    path = str(tmp_path / "noext")
+    workbook.save(path)
+
+    assert list(walk_files(str(tmp_path))) == [path]
+    assert "python" in extract_text(path)
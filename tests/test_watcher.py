@@ -0,0 +1,63 @@
+import os
+
+import search_index
+from search_index import SearchIndex
+from watcher import FolderWatcher
+
+
+def test_search_reindexes_documents_dropped_by_another_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "INDEX_DIR", str(tmp_path / "index"))
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    path = str(folder / "a.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("python developer")
+
+    watcher = FolderWatcher(str(folder), index=SearchIndex(str(folder)), jobs=1, poll_interval=3600,
+                            use_inotify=False).start()
+    try:
+        assert watcher.wait_ready(10)
+        assert list(watcher.search("python")) == [(path, True)]
+
+        other = SearchIndex(str(folder))
+        other.remove_document(path)
+        other.close()
+
+        assert list(watcher.search("python")) == [(path, True)]
+        assert path in watcher.index.documents()
+    finally:
+        watcher.stop()
+
+
+def test_duplicates_are_kept_without_touching_the_disk(tmp_path, monkeypatch):
+    from dedup import find_duplicates
+
+    folder = tmp_path / "resumes"
+    folder.mkdir()
+    paths = {}
+    for name, text in [("cv.txt", "python"), ("cv (1).txt", "python"), ("other.txt", "javaxx")]:
+        paths[name] = str(folder / name)
+        with open(paths[name], "w", encoding="utf-8") as f:
+            f.write(text)
+
+    watcher = FolderWatcher(str(folder), jobs=1, poll_interval=3600, use_inotify=False).start()
+    try:
+        assert watcher.wait_ready(10)
+        expected = find_duplicates(watcher.files())
+        assert expected == {paths["cv (1).txt"]: paths["cv.txt"]}
+
+        def no_stat(*args, **kwargs):
+            raise AssertionError("duplicates() touched the disk")
+
+        with monkeypatch.context() as m:
+            m.setattr(os, "stat", no_stat)
+            assert watcher.duplicates() == expected
+            assert watcher.duplicates([paths["cv.txt"]]) == {}
+
+        with open(paths["other.txt"], "w", encoding="utf-8") as f:
+            f.write("python")
+        os.remove(paths["cv (1).txt"])
+        watcher._reconcile([paths["other.txt"], paths["cv (1).txt"]])
+        assert watcher.duplicates() == find_duplicates(watcher.files()) == {paths["other.txt"]: paths["cv.txt"]}
+    finally:
+        watcher.stop()
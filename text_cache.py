@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from extractors import EXTRACTOR_VERSION
+
+# The cache lives outside the searched folder so it never shows up in results
+# and works for read-only shares. Override with SEARCHSTRING_CACHE.
+DEFAULT_CACHE_PATH = os.environ.get(
+    "SEARCHSTRING_CACHE",
+    os.path.join(os.path.expanduser("~"), ".searchstring", "text_cache.sqlite"),
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # Compressed text, not source file size
+EVICT_TO = 0.9  # Once over max_bytes, evict down to this fraction of it
+
+
+class TextCache:
+    """
+    On-disk cache of extracted text keyed by absolute path, size and mtime.
+
+    Entries are invalidated automatically when a file's size or mtime changes
+    (all of them when EXTRACTOR_VERSION does) and evicted least-recently-used
+    first, down to EVICT_TO of max_bytes, once the compressed text exceeds
+    max_bytes. hits/misses/evictions count lookups since the cache was
+    opened. For paged formats (PDFs) the offset where each page starts in the text
+    is kept too, so hits in cached text can be given page numbers.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS texts ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(texts)")]
+        if "pages" not in columns:
+            # Caches written before page offsets were kept
+            self._conn.execute("ALTER TABLE texts ADD COLUMN pages BLOB")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS texts_last_used ON texts (last_used)")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != EXTRACTOR_VERSION:
+            # Extracted by another version of the extractors
+            self._conn.execute("DELETE FROM texts")
+            self._conn.execute(f"PRAGMA user_version = {EXTRACTOR_VERSION}")
+        # Kept up to date by put/discard/_evict rather than summed on every put
+        self._total = self._sum_nbytes()
+        # Content digests for finding duplicate files (see dedup.py)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " digest TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, filepath, st=None, with_pages=False):
+        """
+        Return cached text for filepath, or None if missing or stale. With
+        with_pages, return (text, page start offsets or None) instead.
+        """
+        path = os.path.abspath(filepath)
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, data, pages FROM texts WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE texts SET last_used = ? WHERE path = ?", (time.time(), path)
+            )
+            self._conn.commit()
+        text = zlib.decompress(row[2]).decode("utf-8", errors="surrogatepass")
+        if not with_pages:
+            return text
+        page_starts = None
+        if row[3] is not None:
+            page_starts = array("Q")
+            page_starts.frombytes(row[3])
+            page_starts = page_starts.tolist()
+        return text, page_starts
+
+    def put(self, filepath, text, st, page_starts=None):
+        """
+        Store text for filepath as extracted from the file described by st,
+        with the offset of each page in text for paged formats.
+        """
+        path = os.path.abspath(filepath)
+        data = zlib.compress(text.encode("utf-8", errors="surrogatepass"), 1)
+        pages = array("Q", page_starts).tobytes() if page_starts is not None else None
+        with self._lock:
+            self._total -= self._nbytes(path)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO texts (path, size, mtime_ns, nbytes, last_used, data, pages)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, len(data), time.time(), data, pages),
+            )
+            self._total += len(data)
+            self._evict()
+            self._conn.commit()
+
+    def extract(self, filepath, extract_fn):
+        """Return the text of filepath, calling extract_fn only on a cache miss."""
+        try:
+            # Stat before extracting so a file modified mid-extraction is
+            # re-extracted next time instead of being cached as current.
+            st = os.stat(filepath)
+        except OSError:
+            return extract_fn(filepath)
+        text = self.get(filepath, st)
+        if text is None:
+            text = extract_fn(filepath)
+            if text is not None:
+                self.put(filepath, text, st)
+        return text
+
+    def get_digest(self, filepath, st):
+        """Return the content digest stored for filepath, or None if missing or stale."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, digest FROM digests WHERE path = ?", (os.path.abspath(filepath),)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return row[2]
+
+    def put_digest(self, filepath, st, digest):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO digests (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(filepath), st.st_size, st.st_mtime_ns, digest),
+            )
+            self._conn.commit()
+
+    def discard(self, filepath):
+        path = os.path.abspath(filepath)
+        with self._lock:
+            self._total -= self._nbytes(path)
+            self._conn.execute("DELETE FROM texts WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM digests WHERE path = ?", (path,))
+            self._conn.commit()
+
+    def _nbytes(self, path):
+        row = self._conn.execute("SELECT nbytes FROM texts WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def _sum_nbytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM texts").fetchone()[0]
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        # Other processes may share the cache: recount before evicting. Going
+        # down to EVICT_TO of max_bytes keeps this off the following puts.
+        self._total = self._sum_nbytes()
+        if self._total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO
+        while self._total > target:
+            rows = self._conn.execute("SELECT path, nbytes FROM texts ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                break
+            for path, nbytes in rows:
+                self._conn.execute("DELETE FROM texts WHERE path = ?", (path,))
+                self.evictions += 1
+                self._total -= nbytes
+                if self._total <= target:
+                    break
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM texts"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,105 @@
+import os
+from fnmatch import fnmatch
+
+from extractors import SUPPORTED_EXTENSIONS, sniff
+
+
+def _matches_any(relpath, name, patterns):
+    # A pattern without a slash matches the name anywhere in the tree
+    # ("*.tmp", "Archive"); one with a slash matches the relative path.
+    return any(fnmatch(relpath if "/" in pattern else name, pattern) for pattern in patterns)
+
+
+def _wanted_file(path, relpath, name, include, exclude, extensions, sniff_content):
+    if include and not _matches_any(relpath, name, include):
+        return False
+    if exclude and _matches_any(relpath, name, exclude):
+        return False
+    if extensions is None or name.rsplit(".", 1)[-1].lower() in extensions:
+        return True
+    if not sniff_content:
+        return False
+    extractor = sniff(path)
+    return extractor is not None and any(ext in extensions for ext in extractor.extensions)
+
+
+def walk_files(folder, recursive=True, include=None, exclude=None,
+               extensions=SUPPORTED_EXTENSIONS, max_depth=None, follow_symlinks=False, sniff_content=True):
+    """
+    Yield the paths of files under folder as they are found.
+
+    Built on os.scandir, so file/directory checks use the type information
+    returned with each directory listing instead of an extra stat per entry.
+    Filters: include globs (a file must match one, if given), exclude globs
+    (files and whole directories) and extensions (lowercase, without the
+    dot; None for all files). Globs use "/" separators. A file with another
+    extension, or none, is opened with sniff_content and kept if its first
+    bytes are those of one of the extensions' formats (a PDF saved without
+    its .pdf); nothing else is opened. max_depth=0 lists only the top level.
+    Symlinked directories are only entered with follow_symlinks, and each
+    directory is visited at most once so symlink loops terminate.
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    if not recursive:
+        max_depth = 0
+    visited = set()
+    stack = [(folder, "", 0)]
+    while stack:
+        directory, relative, depth = stack.pop()
+        if follow_symlinks:
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error listing {directory}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            relpath = relative + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    if (max_depth is None or depth < max_depth) and not _matches_any(relpath, entry.name, exclude):
+                        subdirs.append((entry.path, relpath + "/", depth + 1))
+                    continue
+                if not entry.is_file(follow_symlinks=True):
+                    continue
+            except OSError:
+                continue
+            if _wanted_file(entry.path, relpath, entry.name, include, exclude, extensions, sniff_content):
+                yield entry.path
+        # Depth-first in name order
+        stack.extend(reversed(subdirs))
+
+
+def accepts(folder, path, recursive=True, include=None, exclude=None,
+            extensions=SUPPORTED_EXTENSIONS, max_depth=None, is_dir=False, sniff_content=True):
+    """
+    Return whether walk_files(folder, ...) with the same filters would yield
+    path, or with is_dir descend into it, without touching the filesystem
+    (other than sniffing a file whose extension is not in extensions).
+    Used to filter paths reported by a folder watcher.
+    """
+    relpath = os.path.relpath(path, folder).replace(os.sep, "/")
+    if relpath == ".":
+        return is_dir
+    if relpath == ".." or relpath.startswith("../"):
+        return False
+    if not recursive:
+        max_depth = 0
+    parts = relpath.split("/")
+    dirs = parts if is_dir else parts[:-1]
+    if max_depth is not None and len(dirs) > max_depth:
+        return False
+    exclude = list(exclude or [])
+    for i, name in enumerate(dirs):
+        if _matches_any("/".join(parts[:i + 1]), name, exclude):
+            return False
+    return is_dir or _wanted_file(path, relpath, parts[-1], list(include or []), exclude, extensions,
+                                  sniff_content)
@@ -0,0 +1,451 @@
+import os
+import sys
+import stat
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import time
+import threading
+
+import profiling
+from dedup import cached_digest, originals
+from extract_pool import default_jobs, extract_files
+from extractors import SUPPORTED_EXTENSIONS
+from folder_search import cheapest_first, search_folder
+from query import compile_query
+from snippets import cached_hits
+from walker import accepts, walk_files
+
+POLL_INTERVAL = 5.0  # Seconds between rescans when inotify is unavailable
+SETTLE_SECONDS = 0.5  # Quiet time to wait for a burst of events to finish
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by the name
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class _Inotify:
+    """Minimal ctypes binding to inotify: one watch per directory, reporting (path, mask)."""
+
+    def __init__(self, libc):
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.dirs = {}  # watch descriptor -> directory path
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return  # Gone already, or not ours to watch
+            raise OSError(e, f"inotify_add_watch {path}: {os.strerror(e)}")
+        self.dirs[wd] = path
+
+    def remove_under(self, path):
+        for wd, watched in list(self.dirs.items()):
+            if watched == path or watched.startswith(path + os.sep):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.dirs[wd]
+
+    def read(self, timeout):
+        """Return the events that arrive within timeout seconds, as (path, mask) pairs."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif directory is not None and name:
+                events.append((os.path.join(directory, os.fsdecode(name)), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Keeps the text cache and search index of one folder current in the
+    background, so a search only has to evaluate the query.
+
+    After an initial pass that brings the index in line with the folder,
+    additions, modifications, deletions and renames are picked up with
+    inotify on Linux (Android included), or by rescanning every
+    poll_interval seconds elsewhere, and only the affected files are
+    re-extracted. The walker's filters apply as for a normal search.
+    """
+
+    def __init__(self, folder, cache=None, index=None, recursive=True, include=None, exclude=None,
+                 jobs=None, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.folder = os.path.abspath(folder)
+        self.cache = cache
+        self.index = index
+        self.recursive = recursive
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        # Leave half the CPUs to searches started while this catches up.
+        self.jobs = jobs or max(default_jobs() // 2, 1)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend = None  # "inotify" or "polling" once running
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()  # One _refresh at a time: watcher thread or a search
+        self._files = set()  # Current files under folder
+        self._known = {}  # path -> (size, mtime_ns) of the version last extracted
+        # For duplicates(): every file's version as last seen, files grouped
+        # by size, and the digests of those sharing their size with another.
+        self._seen = {}
+        self._by_size = {}
+        self._digests = {}
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.index is not None:
+            self.index.close()
+
+    @property
+    def ready(self):
+        """True once every file seen so far has been extracted and indexed."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def files(self):
+        """Return the files currently under the folder, without listing it again."""
+        with self._lock:
+            return sorted(self._files)
+
+    def duplicates(self, filepaths=None):
+        """
+        Return {path: original} for identical files among filepaths (default:
+        files()), as dedup.find_duplicates would, from the sizes and digests
+        kept up to date as files change: no file is statted or read.
+        """
+        wanted = None if filepaths is None else set(filepaths)
+        groups = {}
+        with self._lock:
+            for path, digest in self._digests.items():
+                if wanted is None or path in wanted:
+                    groups.setdefault((self._seen[path][0], digest), []).append(path)
+        return originals(groups.values())
+
+    def search(self, query, exact_match=False, filepaths=None, snippets=False, duplicates=None):
+        """
+        Yield (path, matched) for filepaths (default: files()), or with
+        snippets (path, matched, hits), like search_folder. While up to date,
+        the answer comes straight from the index without statting a single
+        file (snippets aside, which are found in the cached text); until
+        then, or without an index, it falls back to search_folder. Files in
+        duplicates get their original's result, as with search_folder.
+
+        The index may be shared with other searches of the folder, so it is
+        compared with what this watcher last indexed first, and files that
+        differ (dropped or re-indexed by another writer) are brought up to
+        date before answering.
+        """
+        if filepaths is None:
+            filepaths = self.files()
+        duplicates = duplicates or {}
+        if self.index is not None and self.ready:
+            started = time.perf_counter()
+            indexed = self.index.documents()
+            drifted = [path for path in {duplicates.get(path, path) for path in filepaths}
+                       if indexed.get(path) != self._known.get(path)]
+            if drifted:
+                for path in drifted:
+                    # Start from what the index holds; _refresh re-indexes it if the file differs.
+                    if path in indexed:
+                        self._known[path] = indexed[path]
+                    else:
+                        self._known.pop(path, None)
+                self._refresh(drifted)
+            profiling.add_stage("index check", time.perf_counter() - started)
+            started = time.perf_counter()
+            hits = set(self.index.search(query, exact_match))
+            profiling.add_stage("index lookup", time.perf_counter() - started)
+            compiled = compile_query(query, exact_match)
+            for path in filepaths:
+                original = duplicates.get(path, path)
+                matched = original in hits
+                if snippets:
+                    yield path, matched, cached_hits(self.cache, original, compiled) if matched else []
+                else:
+                    yield path, matched
+            return
+        results = search_folder(filepaths, query, exact_match, self.cache, self.index, self.jobs, snippets,
+                                duplicates)
+        try:
+            yield from results
+        finally:
+            results.close()
+
+    # --- Background thread ---
+
+    def _accepts(self, path, is_dir=False):
+        return accepts(self.folder, path, self.recursive, self.include, self.exclude,
+                       SUPPORTED_EXTENSIONS, is_dir=is_dir)
+
+    def _tracked(self, path):
+        with self._lock:
+            return path in self._files
+
+    def _walk(self, folder):
+        if folder == self.folder:
+            return walk_files(folder, self.recursive, self.include, self.exclude)
+        # A subfolder that appeared: the filters are relative to self.folder.
+        return (path for path in walk_files(folder, self.recursive) if self._accepts(path))
+
+    def _run(self):
+        inotify = None
+        libc = _load_libc() if self.use_inotify else None
+        if libc is not None:
+            try:
+                inotify = _Inotify(libc)
+                # Watches go up before the initial scan so no change slips
+                # in between.
+                self._watch_tree(inotify, self.folder)
+                self.backend = "inotify"
+            except OSError as e:
+                print(f"inotify unavailable ({e}); polling {self.folder} instead")
+                if inotify is not None:
+                    inotify.close()
+                inotify = None
+        if inotify is None:
+            self.backend = "polling"
+        try:
+            self._initial_scan()
+            if inotify is not None:
+                self._watch_inotify(inotify)
+            else:
+                self._watch_polling()
+        except Exception as e:
+            print(f"Stopped watching {self.folder}: {e}")
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _watch_tree(self, inotify, directory):
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            if not self._accepts(directory, is_dir=True):
+                continue
+            inotify.add_watch(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+
+    def _initial_scan(self):
+        files = list(self._walk(self.folder))
+        with self._lock:
+            self._files = set(files)
+        if self.index is not None:
+            stale = self.index.sync(files)
+            self._known = {path: version for path, version in self.index.documents().items() if path not in stale}
+            for path in files:
+                version = self._known.get(path)
+                if path in stale:
+                    version = (stale[path].st_size, stale[path].st_mtime_ns)
+                if version is not None:
+                    self._see(path, version)
+        else:
+            stale = {}
+            for path in files:
+                try:
+                    stale[path] = os.stat(path)
+                except OSError:
+                    continue
+                self._see(path, (stale[path].st_size, stale[path].st_mtime_ns))
+        self._update(stale)
+        self._hash_shared()
+        self._ready.set()
+
+    def _watch_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            current = set(self._walk(self.folder))
+            with self._lock:
+                changed = current ^ self._files
+            changed.update(current)  # _reconcile skips the ones that did not change
+            self._reconcile(changed)
+
+    def _watch_inotify(self, inotify):
+        while not self._stop.is_set():
+            events = inotify.read(1.0)
+            if not events:
+                continue
+            self._ready.clear()
+            # Editors and copies write in several steps; wait for them to settle.
+            while not self._stop.is_set():
+                more = inotify.read(SETTLE_SECONDS)
+                if not more:
+                    break
+                events.extend(more)
+            dirty = set()
+            rescan = False
+            for path, mask in events:
+                if path is None:
+                    rescan = True  # Event queue overflowed; some changes are lost
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_tree(inotify, path)
+                        dirty.update(self._walk(path))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        inotify.remove_under(path)
+                        with self._lock:
+                            dirty.update(p for p in self._files if p.startswith(path + os.sep))
+                elif self._accepts(path) or self._tracked(path):
+                    # A deleted file found by sniffing no longer sniffs as one
+                    dirty.add(path)
+            if rescan:
+                with self._lock:
+                    dirty.update(self._files)
+                dirty.update(self._walk(self.folder))
+            self._reconcile(dirty)
+
+    def _reconcile(self, paths):
+        """Bring the given paths (changed, new or gone) up to date."""
+        self._refresh(paths)
+        self._ready.set()
+
+    def _refresh(self, paths):
+        with self._update_lock:
+            stale = {}
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is None or not stat.S_ISREG(st.st_mode):
+                    self._forget(path)
+                    continue
+                with self._lock:
+                    self._files.add(path)
+                self._see(path, (st.st_size, st.st_mtime_ns))
+                if self._known.get(path) != (st.st_size, st.st_mtime_ns):
+                    stale[path] = st
+            self._update(stale)
+            self._hash_shared()
+
+    def _forget(self, path):
+        with self._lock:
+            self._files.discard(path)
+            self._unsee(path)
+        if self._known.pop(path, None) is None:
+            return
+        if self.index is not None:
+            self.index.remove_document(path)
+        if self.cache is not None:
+            self.cache.discard(path)
+
+    def _see(self, path, version):
+        with self._lock:
+            if self._seen.get(path) == version:
+                return
+            self._unsee(path)
+            self._seen[path] = version
+            self._by_size.setdefault(version[0], set()).add(path)
+
+    def _unsee(self, path):
+        # Callers hold self._lock
+        version = self._seen.pop(path, None)
+        if version is None:
+            return
+        group = self._by_size[version[0]]
+        group.discard(path)
+        if not group:
+            del self._by_size[version[0]]
+        self._digests.pop(path, None)
+
+    def _hash_shared(self):
+        """Hash the files that share their size with another and have no digest yet."""
+        with self._lock:
+            pending = [path for size, group in self._by_size.items() if size and len(group) > 1
+                       for path in group if path not in self._digests]
+        for path in pending:
+            if self._stop.is_set():
+                return
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest = cached_digest(path, st, self.cache)
+            with self._lock:
+                # Changed since it was seen: its new version is hashed when the change comes in
+                if digest is not None and self._seen.get(path) == (st.st_size, st.st_mtime_ns):
+                    self._digests[path] = digest
+
+    def _update(self, stale):
+        if not stale:
+            return
+        if self.index is None and self.cache is None:
+            self._known.update((path, (st.st_size, st.st_mtime_ns)) for path, st in stale.items())
+            return
+        sizes = {path: st.st_size for path, st in stale.items()}
+        extracted = extract_files(cheapest_first(stale, sizes), self.cache, self.jobs)
+        try:
+            for path, text in extracted:
+                if self._stop.is_set():
+                    return
+                if text is None:
+                    continue  # Timed out or crashed its worker: retried on the next change or search
+                if self.index is not None:
+                    self.index.add_document(path, text, stale[path])
+                self._known[path] = (stale[path].st_size, stale[path].st_mtime_ns)
+        finally:
+            extracted.close()